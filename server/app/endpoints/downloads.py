@@ -18,11 +18,16 @@
 """ASF Infrastructure Reporting Dashboard"""
 
 """Handler for download stats - ported from https://github.com/apache/infrastructure-dlstats"""
+import asyncio
+import quart
 import asfquart
 from asfquart.auth import Requirements as R
-from ..lib import middleware, config
+from ..lib import middleware, config, reportstore, admission, downloadindex
 from ..plugins import downloads
 
+MAX_REPORT_MONTHS = 24  # Max number of monthly reports to serve in a single request
+MAX_TOP_ARTIFACTS = 50  # Max number of ASF-wide top artifacts to list
+
 @asfquart.APP.route(
     "/api/downloads",
 )
@@ -35,7 +40,27 @@ async def process_downloads():
     duration = form_data.get("duration", 7)        # Timespan to search (in whole days)
     filters = form_data.get("filters", "empty_ua,no_query") # Various search filters
     add_metadata = form_data.get("meta", "no")
-    stats, params = await downloads.generate_stats(project, duration, filters)
+    view = form_data.get("view", "full")           # Full per-artifact stats, or one of downloads.STATS_VIEWS
+    if view != "full" and view not in downloads.STATS_VIEWS:
+        return {"success": False, "message": f"Invalid view specified: {view}"}, 400
+    if not downloads.is_known_project(project):
+        return {"success": False, "message": f"Unknown project: {project}"}, 404
+    try:
+        downloads.parse_duration(duration)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}, 400
+    try:
+        stats, params, views = await downloads.generate_stats(project, duration, filters)
+    except admission.Overloaded as e:
+        return {"success": False, "message": str(e)}, 503, {"Retry-After": str(e.retry_after)}
+    if view != "full":
+        if add_metadata == "yes":
+            return {
+                "query": params,
+                view: views[view],
+            }
+        return views[view]
+    stats = downloads.stats_as_json(stats)
     if add_metadata == "yes":
         return {
             "query": params,
@@ -44,5 +69,99 @@ async def process_downloads():
     return stats
 
 
+@asfquart.APP.route(
+    "/api/downloads/status",
+)
+@asfquart.auth.require({R.root})
+async def process_downloads_status():
+    """Returns internal counters for the download stats engine, for sizing and monitoring"""
+    return {
+        "cache": downloads.downloads_data_cache.stats,
+        "negative_cache": downloads.downloads_negative_cache.stats,
+        "known_projects": len(downloads.known_projects),
+        "cache_warming": downloads.cache_warming,
+        "in_flight": downloads.downloads_inflight.stats,
+        "admission": downloads.search_admission.stats,
+        "useragents": downloads.ua_classifier.stats,
+        "scanner": downloads.scan_progress,
+        "bucket_limits": downloads.query_bucket_limits,
+    }
+
+
+@asfquart.APP.route(
+    "/api/downloads/reports",
+)
+async def process_downloads_reports():
+    """Serves stored monthly download reports for a project, straight from disk. Optionally takes a range of
+    months (from=YYYY-MM, to=YYYY-MM), otherwise all stored months are served. Supports If-None-Match."""
+    form_data = await asfquart.utils.formdata()
+    project = form_data.get("project", "")
+    first_month = form_data.get("from", "")
+    last_month = form_data.get("to", "")
+    if not downloads.report_store:
+        return quart.Response(status=404, response="No stored download reports available on this server.")
+    if not reportstore.VALID_PROJECT.match(project) or any(
+        month and not reportstore.VALID_MONTH.match(month) for month in (first_month, last_month)
+    ):
+        return quart.Response(status=400, response="Invalid project name or month range specified.")
+    months = downloads.report_store.months(project, first_month, last_month)[-MAX_REPORT_MONTHS:]
+    if not months:
+        return quart.Response(status=404, response=f"No stored download reports found for {project}.")
+    etag = downloads.report_store.etag(project, months)
+    if etag in quart.request.if_none_match:
+        return quart.Response(status=304, response="", headers={"ETag": f'"{etag}"'})
+    body = await asyncio.to_thread(downloads.report_store.read_range, project, months)
+    return quart.Response(status=200, response=body, content_type="application/json", headers={"ETag": f'"{etag}"'})
+
+
+@asfquart.APP.route(
+    "/api/downloads/reports/index",
+)
+async def process_downloads_reports_index():
+    """Returns the index of stored monthly download reports (totals and sizes per month) for a project"""
+    form_data = await asfquart.utils.formdata()
+    project = form_data.get("project", "")
+    if not downloads.report_store:
+        return quart.Response(status=404, response="No stored download reports available on this server.")
+    if not reportstore.VALID_PROJECT.match(project):
+        return quart.Response(status=400, response="Invalid project name specified.")
+    return {
+        "project": project,
+        "months": downloads.report_store.index(project),
+    }
 
 
+@asfquart.APP.route(
+    "/api/downloads/asf",
+)
+async def process_downloads_asf():
+    """Returns ASF-wide download numbers for a month (month=YYYY-MM, defaults to the latest month indexed):
+    the totals per project, and the top artifacts across all projects, by hits or by bytes (sort=hits|bytes)"""
+    form_data = await asfquart.utils.formdata()
+    month = form_data.get("month", "")
+    sort = form_data.get("sort", "hits")
+    try:
+        limit = min(MAX_TOP_ARTIFACTS, int(form_data.get("limit", MAX_TOP_ARTIFACTS)))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return quart.Response(status=400, response="Invalid limit specified.")
+    if not downloads.download_index:
+        return quart.Response(status=404, response="No ASF-wide download index available on this server.")
+    if (month and not reportstore.VALID_MONTH.match(month)) or sort not in downloadindex.SORT_FIELDS:
+        return quart.Response(status=400, response="Invalid month or sort order specified.")
+    months = downloads.download_index.months()
+    month = month or (months[-1] if months else "")
+    if month not in months:
+        return quart.Response(status=404, response=f"No ASF-wide download numbers found for {month or 'any month'}.")
+    totals = downloads.download_index.totals(month)
+    return {
+        "month": month,
+        "months": months,
+        "totals": {
+            field: sum(project_totals[field] for project_totals in totals.values())
+            for field in ("hits", "hits_unique", "bytes", "artifacts")
+        },
+        "projects": totals,
+        "top_artifacts": downloads.download_index.top_artifacts(month, sort=sort, limit=limit),
+    }
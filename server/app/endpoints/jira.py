@@ -17,6 +17,8 @@
 # under the License.
 """ASF Infrastructure Reporting Dashboard"""
 """Handler for session operations (view current session, log out)"""
+import json
+import quart
 import asfquart
 import asfquart.auth
 from asfquart.auth import Requirements as R
@@ -34,7 +36,24 @@ async def process_jira():
     form_data = await asfquart.utils.formdata()
     session = await asfquart.session.read()
     action = form_data.get("action")
-    if action == "stats":  # Basic stats
-        return jirastats.get_issues()
-
-
+    if action == "stats":  # Basic stats, encoded once per scan. Supports If-None-Match and gzip
+        snapshot = jirastats.get_issues_snapshot()
+        headers = {"ETag": f'"{snapshot["etag"]}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if snapshot["etag"] in quart.request.if_none_match:
+            return quart.Response(status=304, response="", headers=headers)
+        if "gzip" in quart.request.accept_encodings:
+            return quart.Response(
+                status=200,
+                response=snapshot["body_gzip"],
+                content_type="application/json",
+                headers={**headers, "Content-Encoding": "gzip"},
+            )
+        return quart.Response(status=200, response=snapshot["body"], content_type="application/json", headers=headers)
+    if action == "sla":  # SLA aggregates for the same tickets, worked out once per scan
+        snapshot = jirastats.get_issues_snapshot()
+        headers = {"ETag": f'"{snapshot["etag"]}"', "Cache-Control": "no-cache"}
+        if snapshot["etag"] in quart.request.if_none_match:
+            return quart.Response(status=304, response="", headers=headers)
+        return quart.Response(
+            status=200, response=json.dumps(snapshot["sla"]), content_type="application/json", headers=headers
+        )
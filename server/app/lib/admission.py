@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""ASF Infrastructure Reporting Dashboard - Admission control for shared backends"""
+
+import asyncio
+import collections
+import contextlib
+import contextvars
+import time
+import typing
+
+INTERACTIVE = "interactive"  # Someone is waiting for the result
+BACKGROUND = "background"  # Scans, cache warming and other work nobody is waiting for
+
+# The priority of work done in the current task (and any tasks it starts). Background loops set this once.
+# Work that several callers wait on sets a SharedPriority instead.
+current_priority: contextvars.ContextVar = contextvars.ContextVar("current_priority", default=INTERACTIVE)
+
+
+class Overloaded(Exception):
+    """Raised when interactive work cannot be admitted in time, and should be retried later"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SharedPriority:
+    """The priority of work that several callers may be waiting on, such as a coalesced search. It starts out
+    at the priority of whoever started the work, and is raised to INTERACTIVE as soon as anyone interactive joins.
+    That includes work already queued at background priority, which moves to the interactive queue, so nobody
+    who is waiting for a result ends up waiting behind background work.
+    Usage example:
+    priority = SharedPriority(BACKGROUND)
+    current_priority.set(priority)  # <- in the task doing the work
+    priority.raise_to(INTERACTIVE)  # <- when someone interactive joins
+    """
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.queued: list = []  # (controller, waiter) for work queued at background priority
+
+    def raise_to(self, priority: str):
+        """Raises the priority to the given one, if that is higher"""
+        if priority == INTERACTIVE and self.priority != INTERACTIVE:
+            self.priority = INTERACTIVE
+            for controller, waiter in self.queued:
+                controller.promote(waiter)
+            self.queued.clear()
+
+
+class AdmissionController:
+    """Limits how much interactive and background work runs against a shared backend at the same time.
+    Each priority has its own concurrency budget and queue. Background work only starts when no interactive
+    work is waiting and the interactive budget is not used up, so it yields to interactive work. Interactive
+    work that would queue behind too many others, or wait too long, fails fast with Overloaded instead.
+    Usage example:
+    controller = AdmissionController(interactive_limit=8, background_limit=2, max_queued=32, max_wait=10)
+    async with controller.admit():  # <- priority taken from current_priority, unless given
+        await expensive_search()
+    """
+
+    def __init__(self, interactive_limit: int, background_limit: int, max_queued: int, max_wait: float, retry_after: int = 30):
+        self.limits = {INTERACTIVE: interactive_limit, BACKGROUND: background_limit}
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.running = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.admitted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.rejected = 0
+        self.wait_total = {INTERACTIVE: 0.0, BACKGROUND: 0.0}
+        self.wait_max = {INTERACTIVE: 0.0, BACKGROUND: 0.0}
+        self._waiters: typing.Dict[str, collections.deque] = {INTERACTIVE: collections.deque(), BACKGROUND: collections.deque()}
+
+    def _can_run(self, priority: str) -> bool:
+        if priority == INTERACTIVE:
+            return self.running[INTERACTIVE] < self.limits[INTERACTIVE]
+        return (
+            self.running[BACKGROUND] < self.limits[BACKGROUND]
+            and self.running[INTERACTIVE] < self.limits[INTERACTIVE]
+            and not self._waiters[INTERACTIVE]
+        )
+
+    def _wake(self):
+        """Hands free slots to waiting work, interactive work first. Waiters learn the priority of their slot."""
+        for priority in (INTERACTIVE, BACKGROUND):
+            waiters = self._waiters[priority]
+            while waiters and self._can_run(priority):
+                waiter = waiters.popleft()
+                if not waiter.done():  # Skip waiters that already gave up
+                    self.running[priority] += 1
+                    waiter.set_result(priority)
+
+    def promote(self, waiter: asyncio.Future):
+        """Moves background work that is still queued to the interactive queue, see SharedPriority"""
+        if waiter in self._waiters[BACKGROUND] and not waiter.done():
+            self._waiters[BACKGROUND].remove(waiter)
+            self._waiters[INTERACTIVE].append(waiter)
+            self._wake()
+
+    async def _acquire(self, priority: str, shared: typing.Optional[SharedPriority] = None) -> str:
+        """Waits for a slot, and returns the priority it was granted at (work may be promoted while queued)"""
+        if not self._waiters[priority] and self._can_run(priority):
+            self.running[priority] += 1
+            return priority
+        if priority == INTERACTIVE and len(self._waiters[INTERACTIVE]) >= self.max_queued:
+            self.rejected += 1
+            raise Overloaded(f"Too many requests queued ({self.max_queued}), try again later", self.retry_after)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        if shared and priority == BACKGROUND:
+            shared.queued.append((self, waiter))
+        try:
+            return await asyncio.wait_for(waiter, timeout=self.max_wait if priority == INTERACTIVE else None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():  # Got a slot just as we gave up, pass it on
+                self._release(waiter.result())
+            else:
+                for waiters in self._waiters.values():
+                    if waiter in waiters:
+                        waiters.remove(waiter)
+                        self._wake()  # Background work may have been waiting on us
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise Overloaded(f"No capacity within {self.max_wait} seconds, try again later", self.retry_after)
+            raise
+        finally:
+            if shared and (self, waiter) in shared.queued:
+                shared.queued.remove((self, waiter))
+
+    def _release(self, priority: str):
+        self.running[priority] -= 1
+        self._wake()
+
+    @contextlib.asynccontextmanager
+    async def admit(self, priority: typing.Optional[str] = None):
+        """Waits for a slot for work of the given priority (or current_priority), holding it until done"""
+        shared = None
+        priority = priority or current_priority.get()
+        if isinstance(priority, SharedPriority):
+            shared, priority = priority, priority.priority
+        started = time.monotonic()
+        priority = await self._acquire(priority, shared)
+        waited = time.monotonic() - started
+        self.admitted[priority] += 1
+        self.wait_total[priority] += waited
+        self.wait_max[priority] = max(self.wait_max[priority], waited)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    @property
+    def stats(self) -> dict:
+        """Returns usage counters, queue depths and wait times per priority"""
+        return {
+            "rejected": self.rejected,
+            **{
+                priority: {
+                    "limit": self.limits[priority],
+                    "running": self.running[priority],
+                    "queued": sum(1 for waiter in self._waiters[priority] if not waiter.done()),
+                    "admitted": self.admitted[priority],
+                    "wait_avg": round(self.wait_total[priority] / self.admitted[priority], 3) if self.admitted[priority] else 0.0,
+                    "wait_max": round(self.wait_max[priority], 3),
+                }
+                for priority in (INTERACTIVE, BACKGROUND)
+            },
+        }
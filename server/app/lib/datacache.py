@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""ASF Infrastructure Reporting Dashboard - In-memory data caches"""
+
+import asyncio
+import collections
+import functools
+import sys
+import time
+import typing
+
+
+def estimate_size(obj: typing.Any) -> int:
+    """Estimates the memory footprint (in bytes) of a JSON-like structure of dicts, lists, scalars and arrays"""
+    size = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if getattr(item, "base", None) is not None and hasattr(item, "nbytes"):
+            size += item.nbytes  # An array view, whose data is held (and not sized up) elsewhere
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set)):
+            stack.extend(item)
+    return size
+
+
+class DataCache:
+    """A keyed LRU cache with per-item expiry, bounded by the estimated memory size of its contents
+    rather than by the number of items. Lookups and insertions are O(1); eviction drops expired items
+    first, then the least recently used ones, until the new item fits.
+    Items past their expiry can be kept for a while longer (stale_ttl), to be served with get_stale while
+    they are being refreshed. If track_requests is set, the cache also counts how often each key is requested,
+    so the most popular keys can be refreshed before they expire (see expiring).
+    Usage example:
+    cache = DataCache(max_bytes=50*1024*1024, ttl=7200, stale_ttl=3600, track_requests=True)
+    cache.set(("httpd", 7), data)
+    data = cache.get(("httpd", 7))  # <- None if not cached or expired
+    data, stale = cache.get_stale(("httpd", 7))  # <- stale is True if expired, but still within stale_ttl
+    """
+
+    def __init__(self, max_bytes: int, ttl: int, stale_ttl: int = 0, track_requests: bool = False):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.track_requests = track_requests
+        self.bytes_used = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.requests: collections.Counter = collections.Counter()  # key -> number of (recent) lookups
+        self._items: collections.OrderedDict = collections.OrderedDict()  # key -> (expires, size, value)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _lookup(self, key: typing.Hashable) -> typing.Optional[tuple]:
+        """Returns the cache entry for a key, unless it is missing or past the stale window"""
+        if self.track_requests:
+            self.requests[key] += 1
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] + self.stale_ttl < time.time():  # Expired, and too old to serve even as stale
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._items.move_to_end(key)
+        return item
+
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        """Returns the cached value for a key, or the default value if not cached or expired"""
+        item = self._lookup(key)
+        if item is None or item[0] < time.time():
+            self.misses += 1
+            return default
+        self.hits += 1
+        return item[2]
+
+    def get_stale(self, key: typing.Hashable, default: typing.Any = None) -> typing.Tuple[typing.Any, bool]:
+        """Returns the cached value for a key, and whether it is stale (expired, but still within stale_ttl),
+        or the default value and False if not cached"""
+        item = self._lookup(key)
+        if item is None:
+            self.misses += 1
+            return default, False
+        if item[0] < time.time():
+            self.stale_hits += 1
+            return item[2], True
+        self.hits += 1
+        return item[2], False
+
+    def set(self, key: typing.Hashable, value: typing.Any, ttl: typing.Optional[int] = None):
+        """Adds or replaces a cached value, evicting older items if needed to stay within the memory budget"""
+        if key in self._items:
+            self._remove(key)
+        size = estimate_size(value)
+        if size > self.max_bytes:  # Would never fit, don't bother
+            return
+        if self.bytes_used + size > self.max_bytes:
+            self.prune()
+        while self._items and self.bytes_used + size > self.max_bytes:
+            oldest_key = next(iter(self._items))
+            self._remove(oldest_key)
+            self.evictions += 1
+        self._items[key] = (time.time() + (ttl if ttl is not None else self.ttl), size, value)
+        self.bytes_used += size
+
+    def delete(self, key: typing.Hashable):
+        """Removes an item from the cache, if present"""
+        if key in self._items:
+            self._remove(key)
+
+    def prune(self):
+        """Removes all expired items from the cache, including stale ones"""
+        now = time.time()
+        for key in [k for k, v in self._items.items() if v[0] < now]:
+            self._remove(key)
+            self.expirations += 1
+
+    def expiring(self, within: int, top: int) -> list:
+        """Returns those of the [top] most requested keys that are either not cached, or will expire within
+        [within] seconds, most requested first. These are the keys worth refreshing ahead of time."""
+        deadline = time.time() + within
+        keys = []
+        for key, _count in self.requests.most_common(top):
+            item = self._items.get(key)
+            if item is None or item[0] < deadline:
+                keys.append(key)
+        return keys
+
+    def decay_requests(self):
+        """Halves the request counts, dropping keys that were only requested once, so popularity reflects
+        recent requests more than older ones, and keys no longer requested are eventually forgotten"""
+        for key, count in list(self.requests.items()):
+            if count > 1:
+                self.requests[key] = count // 2
+            else:
+                del self.requests[key]
+
+    def _remove(self, key: typing.Hashable):
+        _expires, size, _value = self._items.pop(key)
+        self.bytes_used -= size
+
+    @property
+    def stats(self) -> dict:
+        """Returns usage counters for the cache"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "items": len(self._items),
+            "bytes_used": self.bytes_used,
+            "bytes_max": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "keys_tracked": len(self.requests),
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single execution. The first caller for a key
+    starts the work, and callers arriving while it is still running await that same result instead of
+    starting their own. The work runs as a separate task, so one caller going away (for instance, a client
+    disconnecting) does not cancel it for the others.
+    Usage example:
+    flights = SingleFlight()
+    result = await flights.run(("httpd", 7), expensive_query, "httpd", 7)
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.coalesced = 0
+        self._flights: dict = {}  # key -> running task
+
+    def start(self, key: typing.Hashable, func: typing.Callable, *args, **kwargs) -> asyncio.Future:
+        """Starts running func(*args, **kwargs) for this key, unless it is already in progress, and returns
+        the running task without waiting for it"""
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._flights[key] = task
+            task.add_done_callback(functools.partial(self._land, key))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return task
+
+    async def run(self, key: typing.Hashable, func: typing.Callable, *args, **kwargs) -> typing.Any:
+        """Runs func(*args, **kwargs) for this key, or joins the run already in progress"""
+        return await asyncio.shield(self.start(key, func, *args, **kwargs))
+
+    def _land(self, key: typing.Hashable, task: asyncio.Future):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # Mark any exception as retrieved, even if every caller went away
+
+    @property
+    def stats(self) -> dict:
+        """Returns usage counters for in-flight deduplication"""
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""ASF Infrastructure Reporting Dashboard - ASF-wide index of monthly download totals and top artifacts"""
+
+import heapq
+import json
+import os
+import threading
+import typing
+
+from . import reportstore
+
+INDEX_DIR = "asf_index"  # Where to keep the ASF-wide index, one directory per month, inside the data dir
+TOP_ARTIFACTS = 50  # Number of top artifacts (by hits and by bytes) to keep per project and month
+SORT_FIELDS = ("hits", "bytes")
+
+
+class DownloadIndex:
+    """Keeps ASF-wide download numbers per month, built from the monthly project reports as they are written:
+    the totals for each project, and each project's top artifacts by hits and by bytes. As no artifact outside
+    a project's own top N can be in the ASF-wide top N, the ASF-wide top artifacts are found by merging the
+    per-project lists, without going back to the reports. Each project's numbers for a month are kept in their own
+    small file (asf_index/YYYY-MM/project.json), so writing a report only rewrites that project's file. Like
+    ReportStore, updates are blocking and meant to be run in a thread, so they are made atomic and guarded by a lock.
+    Usage example:
+    index = DownloadIndex("/var/data/downloads")
+    index.update("httpd", "2024-05", report["files"])
+    top = index.top_artifacts("2024-05", sort="bytes", limit=20)
+    """
+
+    def __init__(self, datadir: str, top_artifacts: int = TOP_ARTIFACTS):
+        self.index_dir = os.path.join(datadir, INDEX_DIR)
+        self.top_n = top_artifacts
+        self._months: dict = {}  # month -> {project: {"totals": {...}, "top": [[artifact, hits, bytes], ...]}}
+        self._top: dict = {}  # (month, sort) -> ASF-wide top artifacts, until the month is updated again
+        self._lock = threading.Lock()
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def months(self) -> typing.List[str]:
+        """Returns the months that are in the index"""
+        return sorted(
+            dirname
+            for dirname in os.listdir(self.index_dir)
+            if reportstore.VALID_MONTH.match(dirname) and os.listdir(os.path.join(self.index_dir, dirname))
+        )
+
+    def month(self, month: str) -> dict:
+        """Returns the per-project entries for a month, loading them from disk if needed"""
+        if month not in self._months:
+            month_entries = {}
+            month_dir = os.path.join(self.index_dir, month)
+            for filename in sorted(os.listdir(month_dir)) if os.path.isdir(month_dir) else []:
+                project = filename[:-5]
+                if not filename.endswith(".json") or not reportstore.VALID_PROJECT.match(project):
+                    continue
+                try:
+                    with open(os.path.join(month_dir, filename)) as f:
+                        month_entries[project] = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"Download index: Could not load index for {project} in {month}, rebuilding: {e}")
+            self._months[month] = month_entries
+        return self._months[month]
+
+    def update(self, project: str, month: str, files: dict):
+        """Adds (or replaces) a project's numbers for a month, from the files of its monthly report"""
+        entry = {
+            "totals": {
+                "hits": sum(x["hits"] for x in files.values()),
+                "hits_unique": sum(x["hits_unique"] for x in files.values()),
+                "bytes": sum(x["bytes"] for x in files.values()),
+                "artifacts": len(files),
+            },
+            "top": [
+                [artifact, files[artifact]["hits"], files[artifact]["bytes"]]
+                for artifact in sorted(
+                    set(heapq.nlargest(self.top_n, files, key=lambda x: files[x]["hits"]))
+                    | set(heapq.nlargest(self.top_n, files, key=lambda x: files[x]["bytes"]))
+                )
+            ],
+        }
+        with self._lock:
+            month_dir = os.path.join(self.index_dir, month)
+            os.makedirs(month_dir, exist_ok=True)
+            reportstore.write_atomic(
+                os.path.join(month_dir, project + ".json"), json.dumps(entry, separators=(",", ":")).encode("utf-8")
+            )
+            # Readers may be iterating over the entries, so they are replaced rather than changed in place
+            month_entries = dict(self.month(month))
+            month_entries[project] = entry
+            self._months[month] = dict(sorted(month_entries.items()))
+            for sort in SORT_FIELDS:
+                self._top.pop((month, sort), None)
+
+    def import_reports(self, store: reportstore.ReportStore, project: str):
+        """Adds any stored reports of a project that are not in the index yet (written before it existed)"""
+        for month in store.months(project):
+            if project not in self.month(month):
+                report = json.loads(store.read_range(project, [month]))["months"][month]
+                self.update(project, month, report.get("files", {}))
+
+    def totals(self, month: str) -> dict:
+        """Returns the download totals for each project in a month"""
+        return {project: entry["totals"] for project, entry in self.month(month).items()}
+
+    def top_artifacts(self, month: str, sort: str = "hits", limit: int = TOP_ARTIFACTS) -> typing.List[dict]:
+        """Returns the ASF-wide top artifacts of a month, by hits or by bytes"""
+        assert sort in SORT_FIELDS, f"Can only sort by one of: {', '.join(SORT_FIELDS)}"
+        top = self._top.get((month, sort))
+        if top is None:
+            column = 1 if sort == "hits" else 2
+            candidates = (
+                (row[column], project, row)
+                for project, entry in self.month(month).items()
+                for row in entry["top"]
+            )
+            top = [
+                {"project": project, "artifact": row[0], "hits": row[1], "bytes": row[2]}
+                for _value, project, row in heapq.nlargest(self.top_n, candidates, key=lambda x: x[0])
+            ]
+            self._top[(month, sort)] = top
+        return top[:limit]
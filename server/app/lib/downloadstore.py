@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""ASF Infrastructure Reporting Dashboard - Local store for daily download facts"""
+
+import collections
+import json
+import time
+import typing
+import asfpy.sqlite
+
+CREATE_DAILY_DB = """CREATE TABLE "daily" (
+    "project"	TEXT NOT NULL,
+    "provider"	TEXT NOT NULL,
+    "filters"	TEXT NOT NULL,
+    "day"	INTEGER NOT NULL,
+    "artifact"	TEXT NOT NULL,
+    "hits"	INTEGER NOT NULL,
+    "unique_ips"	INTEGER NOT NULL,
+    "bytes"	INTEGER NOT NULL,
+    "cca2"	TEXT NOT NULL,
+    "useragents"	TEXT NOT NULL,
+    PRIMARY KEY("project", "provider", "filters", "day", "artifact")
+) WITHOUT ROWID;"""
+CREATE_DAYS_DB = """CREATE TABLE "days" (
+    "project"	TEXT NOT NULL,
+    "provider"	TEXT NOT NULL,
+    "filters"	TEXT NOT NULL,
+    "day"	INTEGER NOT NULL,
+    "stored_at"	INTEGER NOT NULL,
+    PRIMARY KEY("project", "provider", "filters", "day")
+) WITHOUT ROWID;"""
+
+# A single artifact's downloads on a single (UTC) day. cca2 and useragents are dicts of key -> hits,
+# with user agents already classified as "OS / Agent family".
+DailyRecord = collections.namedtuple(
+    "DailyRecord",
+    (
+        "artifact",
+        "day",
+        "hits",
+        "unique_ips",
+        "bytes",
+        "cca2",
+        "useragents",
+    ),
+)
+
+
+class DailyDownloadStore:
+    """SQLite-backed store of per-day, per-artifact download aggregates. Once a day is over, its download
+    stats never change, so completed days only ever need to be fetched from Elasticsearch once.
+    A day is recorded as stored even if there were no downloads at all that day, so empty days are not
+    refetched either.
+    Usage example:
+    store = DailyDownloadStore("/tmp/downloads.db")
+    store.add_day("httpd", "fastly", "empty_ua,no_query", 1714521600, records)
+    records = store.fetch("httpd", "fastly", "empty_ua,no_query", 1714521600, 1717113600)
+    """
+
+    def __init__(self, db_filepath: str):
+        self.db = asfpy.sqlite.DB(db_filepath)
+        if not self.db.table_exists("daily"):
+            self.db.runc(CREATE_DAILY_DB)
+        if not self.db.table_exists("days"):
+            self.db.runc(CREATE_DAYS_DB)
+
+    def stored_days(self, project: str, provider: str, filters: str, first_day: int, last_day: int) -> set:
+        """Returns the set of days (UTC epochs) between first_day and last_day (inclusive) that are in the store"""
+        self.db.run(
+            "SELECT day FROM days WHERE project = ? AND provider = ? AND filters = ? AND day >= ? AND day <= ?",
+            project, provider, filters, first_day, last_day,
+        )
+        return set(row["day"] for row in self.db.cursor.fetchall())
+
+    def add_day(self, project: str, provider: str, filters: str, day: int, records: typing.Iterable[DailyRecord]):
+        """Stores (or replaces) all artifact records for a single completed day"""
+        rows = [
+            (
+                project, provider, filters, day, record.artifact, record.hits, record.unique_ips, record.bytes,
+                json.dumps(record.cca2), json.dumps(record.useragents),
+            )
+            for record in records
+        ]
+        self.db.run("BEGIN")
+        try:
+            self.db.run(
+                "DELETE FROM daily WHERE project = ? AND provider = ? AND filters = ? AND day = ?",
+                project, provider, filters, day,
+            )
+            self.db.cursor.executemany("INSERT INTO daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.run(
+                "INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?, ?)",
+                project, provider, filters, day, int(time.time()),
+            )
+            self.db.run("COMMIT")
+        except Exception:
+            self.db.run("ROLLBACK")
+            raise
+
+    def fetch(self, project: str, provider: str, filters: str, first_day: int, last_day: int) -> typing.List[DailyRecord]:
+        """Returns all stored artifact records between first_day and last_day (inclusive)"""
+        self.db.run(
+            "SELECT artifact, day, hits, unique_ips, bytes, cca2, useragents FROM daily "
+            "WHERE project = ? AND provider = ? AND filters = ? AND day >= ? AND day <= ?",
+            project, provider, filters, first_day, last_day,
+        )
+        return [
+            DailyRecord(
+                row["artifact"], row["day"], row["hits"], row["unique_ips"], row["bytes"],
+                json.loads(row["cca2"]), json.loads(row["useragents"]),
+            )
+            for row in self.db.cursor.fetchall()
+        ]
+
+    def prune(self, oldest_day: int):
+        """Removes all days older than oldest_day from the store"""
+        self.db.run("BEGIN")
+        self.db.run("DELETE FROM daily WHERE day < ?", oldest_day)
+        self.db.run("DELETE FROM days WHERE day < ?", oldest_day)
+        self.db.run("COMMIT")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""ASF Infrastructure Reporting Dashboard - Precompiled search body templates"""
+
+import typing
+
+
+class QueryTemplate:
+    """A search body built once, with placeholders for the parts that vary between searches. The builder is
+    called with a unique placeholder string for each variable, and the places those placeholders end up in
+    are recorded. Rendering then only copies the containers along the way to those places, and shares the rest
+    of the (never modified) body, so the result is the same as calling the builder with the actual values.
+    Variables can be used as whole values (of any type), or inside strings, where they are substituted as text.
+    Usage example:
+    template = QueryTemplate(lambda project, size: {"query": {"prefix": {"uri": f"/{project}/"}}, "size": size},
+                             ("project", "size"))
+    body = template.render(project="httpd", size=60)
+    """
+
+    def __init__(self, builder: typing.Callable[..., dict], variables: typing.Iterable[str]):
+        self.variables = tuple(variables)
+        self.placeholders = {name: f"\x00{name}\x00" for name in self.variables}
+        self.body = builder(**self.placeholders)
+        self.slots: typing.List[tuple] = []  # (path, string with placeholders, variables used)
+        self._find_slots(self.body, ())
+
+    def _find_slots(self, node: typing.Any, path: tuple):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                self._find_slots(value, path + (key,))
+        elif isinstance(node, list):
+            for index, value in enumerate(node):
+                self._find_slots(value, path + (index,))
+        elif isinstance(node, str) and "\x00" in node:
+            used = tuple(name for name, placeholder in self.placeholders.items() if placeholder in node)
+            self.slots.append((path, node, used))
+
+    def render(self, **values) -> dict:
+        """Returns the search body with the placeholders replaced by actual values"""
+        body = dict(self.body)
+        copied = {id(body)}
+        for path, text, used in self.slots:
+            node: typing.Any = body
+            for key in path[:-1]:
+                child = node[key]
+                if id(child) not in copied:
+                    child = dict(child) if isinstance(child, dict) else list(child)
+                    copied.add(id(child))
+                    node[key] = child
+                node = child
+            if len(used) == 1 and text == self.placeholders[used[0]]:  # Whole value
+                node[path[-1]] = values[used[0]]
+            else:
+                for name in used:
+                    text = text.replace(self.placeholders[name], str(values[name]))
+                node[path[-1]] = text
+        return body
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""ASF Infrastructure Reporting Dashboard - Compressed, indexed store for monthly download reports"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import typing
+
+INDEX_FILE = "index.json"  # Per-project index of stored months, inside the project's data dir
+REPORT_SUFFIX = ".json.gz"  # Compressed monthly reports, e.g. 2024-05.json.gz
+LEGACY_REPORT_SUFFIX = ".json"  # Plain JSON monthly reports, still written for existing consumers
+VALID_PROJECT = re.compile(r"^[a-z0-9][-_.a-z0-9]*$")
+VALID_MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+
+def write_atomic(filename: str, data: bytes):
+    """Writes a file in one go, so readers never see a partially written file"""
+    with open(filename + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(filename + ".tmp", filename)
+
+
+class ReportStore:
+    """Stores monthly download reports as compact, gzipped JSON, alongside a small per-project index of the
+    stored months with their totals, sizes and ETags. The index lets readers answer conditional requests and
+    list months without opening the reports themselves. Writes are blocking and meant to be run in a thread
+    (see asyncio.to_thread), so they are made atomic and the index is guarded by a lock.
+    Usage example:
+    store = ReportStore("/var/data/downloads")
+    store.write("httpd", "2024-05", {"query": {...}, "files": {...}})
+    etag = store.etag("httpd", ["2024-04", "2024-05"])
+    body = store.read_range("httpd", ["2024-04", "2024-05"])
+    """
+
+    def __init__(self, datadir: str, legacy_json: bool = True):
+        self.datadir = datadir
+        self.legacy_json = legacy_json
+        self._indices: dict = {}  # project -> {month: index entry}
+        self._lock = threading.Lock()
+
+    def index(self, project: str) -> dict:
+        """Returns the index of stored months for a project, loading it from disk if needed"""
+        if project not in self._indices:
+            if not os.path.isdir(os.path.join(self.datadir, project)):  # Unknown project, don't keep an index for it
+                return {}
+            index_filename = os.path.join(self.datadir, project, INDEX_FILE)
+            project_index = {}
+            if os.path.exists(index_filename):
+                try:
+                    with open(index_filename) as f:
+                        project_index = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"Report store: Could not load index for {project}, rebuilding: {e}")
+            self._indices[project] = project_index
+        return self._indices[project]
+
+    def write(self, project: str, month: str, report: dict):
+        """Writes (or replaces) a monthly report and updates the project index"""
+        raw = json.dumps(report, separators=(",", ":")).encode("utf-8")
+        self._store(project, month, report, raw)
+        if self.legacy_json:
+            write_atomic(os.path.join(self.datadir, project, month + LEGACY_REPORT_SUFFIX), raw)
+
+    def import_legacy(self, project: str):
+        """Adds plain JSON reports that are not in the index yet (written before the compact format existed)"""
+        project_datadir = os.path.join(self.datadir, project)
+        project_index = self.index(project)
+        for filename in sorted(os.listdir(project_datadir)):
+            month = filename[: -len(LEGACY_REPORT_SUFFIX)]
+            if filename.endswith(LEGACY_REPORT_SUFFIX) and VALID_MONTH.match(month) and month not in project_index:
+                try:
+                    with open(os.path.join(project_datadir, filename), "rb") as f:
+                        report = json.load(f)
+                        updated = os.fstat(f.fileno()).st_mtime
+                except (OSError, json.JSONDecodeError):  # Empty placeholder or broken file, skip it
+                    continue
+                raw = json.dumps(report, separators=(",", ":")).encode("utf-8")
+                self._store(project, month, report, raw, updated=int(updated))
+
+    def _store(self, project: str, month: str, report: dict, raw: bytes, updated: typing.Optional[int] = None):
+        compressed = gzip.compress(raw, mtime=0)  # No timestamp, so identical reports compress identically
+        write_atomic(os.path.join(self.datadir, project, month + REPORT_SUFFIX), compressed)
+        files = report.get("files", {})
+        entry = {
+            "hits": sum(x["hits"] for x in files.values()),
+            "hits_unique": sum(x["hits_unique"] for x in files.values()),
+            "bytes": sum(x["bytes"] for x in files.values()),
+            "artifacts": len(files),
+            "size": len(compressed),
+            "size_uncompressed": len(raw),
+            "etag": hashlib.sha256(raw).hexdigest()[:32],
+            "updated": updated or int(time.time()),
+        }
+        with self._lock:
+            project_index = dict(self.index(project))
+            project_index[month] = entry
+            project_index = dict(sorted(project_index.items()))
+            write_atomic(
+                os.path.join(self.datadir, project, INDEX_FILE), json.dumps(project_index, indent=2).encode("utf-8")
+            )
+            self._indices[project] = project_index
+
+    def months(self, project: str, first_month: str = "", last_month: str = "") -> typing.List[str]:
+        """Returns the stored months for a project, optionally only those between first_month and last_month"""
+        return [
+            month
+            for month in self.index(project)
+            if (not first_month or month >= first_month) and (not last_month or month <= last_month)
+        ]
+
+    def etag(self, project: str, months: typing.Iterable[str]) -> str:
+        """Returns the ETag for a set of stored months, computed from the index alone"""
+        project_index = self.index(project)
+        tags = ",".join(f"{month}:{project_index[month]['etag']}" for month in months)
+        return hashlib.sha256(f"{project}/{tags}".encode("utf-8")).hexdigest()[:32]
+
+    def read_range(self, project: str, months: typing.Iterable[str]) -> bytes:
+        """Returns a JSON document with the reports for a set of stored months, keyed by month. The stored
+        reports are spliced in as-is, without being parsed and serialized again."""
+        chunks = []
+        for month in months:
+            with open(os.path.join(self.datadir, project, month + REPORT_SUFFIX), "rb") as f:
+                chunks.append(json.dumps(month).encode("utf-8") + b":" + gzip.decompress(f.read()))
+        return b'{"project":' + json.dumps(project).encode("utf-8") + b',"months":{' + b",".join(chunks) + b"}}"
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""ASF Infrastructure Reporting Dashboard - User-Agent classification engine"""
+
+import collections
+import hashlib
+import importlib.metadata
+import json
+import re
+import typing
+import asfpy.sqlite
+import ua_parser.user_agent_parser
+
+UA_MEMO_SIZE = 50000  # Keep the 50,000 most recently seen agent strings in memory
+
+CREATE_USERAGENTS_DB = """CREATE TABLE "useragents" (
+    "agent"	TEXT NOT NULL UNIQUE,
+    "classification"	TEXT NOT NULL,
+    PRIMARY KEY("agent")
+);"""
+CREATE_META_DB = """CREATE TABLE "meta" (
+    "key"	TEXT NOT NULL UNIQUE,
+    "value"	TEXT,
+    PRIMARY KEY("key")
+);"""
+
+
+class UserAgentClassifier:
+    """Classifies user agent strings as "OS family / agent family", e.g. "Windows / Chrome".
+    The same agent strings show up over and over across searches, so classifications are kept in a
+    bounded in-memory memo, backed by an optional on-disk table that survives restarts. The on-disk
+    table is discarded whenever the parser version or the list of internal agents changes.
+    Usage example:
+    classifier = UserAgentClassifier({"Artifactory": ("Artifactory",)}, db_filepath="/tmp/ua.db")
+    ua_key = classifier.classify("Mozilla/5.0 (X11; Linux x86_64) ...")  # -> "Linux / Firefox"
+    classifier.flush()  # <- commit new classifications to disk
+    """
+
+    def __init__(
+        self, internal_agents: dict, db_filepath: typing.Optional[str] = None, memo_size: int = UA_MEMO_SIZE
+    ):
+        self.internal_agents = list(internal_agents.items())
+        self.memo_size = memo_size
+        self.memo_hits = 0
+        self.disk_hits = 0
+        self.parsed = 0
+        self._memo: collections.OrderedDict = collections.OrderedDict()
+        self._pending: dict = {}  # Classifications not yet written to disk
+
+        # Single-pass matcher for internal agents: Each position in the agent string is checked against all
+        # patterns at once, in priority order, via a zero-width lookahead, so overlapping matches are still seen.
+        # The capturing group that matched tells us which internal agent it was.
+        self._internal_groups = []
+        alternatives = []
+        for family, names in self.internal_agents:
+            for name in names:
+                alternatives.append(f"({re.escape(name)})")
+                self._internal_groups.append(family)
+        self._internal_matcher = re.compile(f"(?=(?:{'|'.join(alternatives)}))") if alternatives else None
+
+        self.db = None
+        if db_filepath:
+            self.db = asfpy.sqlite.DB(db_filepath)
+            if not self.db.table_exists("useragents"):
+                self.db.runc(CREATE_USERAGENTS_DB)
+            if not self.db.table_exists("meta"):
+                self.db.runc(CREATE_META_DB)
+            ruleset = self.ruleset
+            stored_ruleset = self.db.fetchone("meta", key="ruleset")
+            if not stored_ruleset or stored_ruleset["value"] != ruleset:
+                self.db.runc("DELETE FROM useragents")
+                self.db.upsert("meta", {"value": ruleset}, key="ruleset")
+
+    @property
+    def ruleset(self) -> str:
+        """Fingerprint of the classification rules in use. If this changes, stored classifications are stale."""
+        try:
+            parser_version = importlib.metadata.version("ua-parser")
+        except importlib.metadata.PackageNotFoundError:
+            parser_version = "unknown"
+        rules = json.dumps([parser_version, self.internal_agents])
+        return hashlib.sha256(rules.encode("utf-8")).hexdigest()
+
+    def classify(self, ua_agent: str) -> str:
+        """Returns the "OS family / agent family" classification of a user agent string"""
+        classification = self._memo.get(ua_agent)
+        if classification is not None:
+            self._memo.move_to_end(ua_agent)
+            self.memo_hits += 1
+            return classification
+        classification = self._pending.get(ua_agent)
+        if classification is None and self.db:
+            row = self.db.fetchone("useragents", agent=ua_agent)
+            if row:
+                classification = row["classification"]
+                self.disk_hits += 1
+        if classification is None:
+            classification = self.parse(ua_agent)
+            self._pending[ua_agent] = classification
+            self.parsed += 1
+        self._memo[ua_agent] = classification
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return classification
+
+    def parse(self, ua_agent: str) -> str:
+        """Classifies a user agent string from scratch, without consulting the memo or disk"""
+        # NOTE: ua_parser will set OS and UA Family to "Other" when it doesn't recognize the UA string.
+        ua = ua_parser.user_agent_parser.Parse(ua_agent)
+        ua_os_family = ua.get("os", {}).get("family", "Unknown")
+        # If OS is "Other", we'll adjust it to "Unknown" ourselves.
+        if ua_os_family == "Other":
+            ua_os_family = "Unknown"
+        # UA family will typically be "Other" when unknown to the parser, we'll address this below.
+        # If the family is empty, we'll also set to Other and adjust later on.
+        ua_agent_family = ua.get("user_agent", {}).get("family", "Other")
+        # Adjust for various package managers we know of
+        if ua_agent_family == "Other":
+            ua_agent_family = self.match_internal(ua_agent) or "Other"
+        # If we still don't know what this is, mark as "Unknown", to distinguish from the combined "Other" chart group.
+        if ua_agent_family == "Other":
+            ua_agent_family = "Unknown"
+        return ua_os_family + " / " + ua_agent_family
+
+    def match_internal(self, ua_agent: str) -> typing.Optional[str]:
+        """Returns the first internal agent (in priority order) that matches the agent string, if any"""
+        if not self._internal_matcher:
+            return None
+        best_group = 0
+        for match in self._internal_matcher.finditer(ua_agent):
+            group = match.lastindex or 0
+            if group and (not best_group or group < best_group):
+                best_group = group
+                if best_group == 1:  # Can't do better than the first pattern
+                    break
+        if not best_group:
+            return None
+        return self._internal_groups[best_group - 1]
+
+    def flush(self):
+        """Writes any new classifications to the on-disk table"""
+        if self.db and self._pending:
+            self.db.run("BEGIN")
+            self.db.cursor.executemany(
+                "INSERT OR REPLACE INTO useragents (agent, classification) VALUES (?, ?)", self._pending.items()
+            )
+            self.db.run("COMMIT")
+        self._pending.clear()
+
+    @property
+    def stats(self) -> dict:
+        """Returns usage counters for the classifier"""
+        return {
+            "memo_items": len(self._memo),
+            "memo_hits": self.memo_hits,
+            "disk_hits": self.disk_hits,
+            "parsed": self.parsed,
+        }
@@ -17,24 +17,54 @@
 # under the License.
 """ASF Infrastructure Reporting Dashboard - Download Statistics Tasks"""
 import asyncio
-from ..lib import middleware, config
+from ..lib import middleware, config, datacache, useragents, downloadstore, reportstore, querytemplate, admission, downloadindex
 import elasticsearch
 import elasticsearch_dsl
 from .. import plugins
 import re
 import time
 import os
-import ua_parser.user_agent_parser
 import aiohttp
 import json
 import datetime
+import typing
+import numpy
+import collections
+import functools
 
 DEFAULT_PROJECTS_LIST = "https://whimsy.apache.org/public/public_ldap_projects.json"
 MAX_HITS = 60  # Max number of artifacts to track in a single search
 MAX_HITS_UA = 60  # Max number of user agents to collate
-DOWNLOADS_CACHE_ITEMS = 200  # Keep the 200 latest search results in cache. 200 results is ~50MB
+DOWNLOADS_CACHE_SIZE = "50mb"  # Max (estimated) memory footprint of cached search results, roughly 200 results
 DOWNLOADS_CACHE_TTL = 7200   # Only cache items for 2 hours
+DOWNLOADS_CACHE_TTL_PARTIAL = 300  # Only cache results with missing providers for 5 minutes
+DOWNLOADS_CACHE_STALE_TTL = 3600  # Serve expired results for up to an hour more, while refreshing them in the background
+DOWNLOADS_NEGATIVE_CACHE_SIZE = "1mb"  # Max (estimated) memory footprint of cached empty results
+DOWNLOADS_NEGATIVE_CACHE_TTL = 900  # Only cache empty results for 15 minutes, in case downloads show up
+DOWNLOADS_CACHE_WARM_INTERVAL = 300  # Check for popular results to refresh every 5 minutes
+DOWNLOADS_CACHE_WARM_KEYS = 20  # Keep the 20 most requested results fresh
+PROVIDER_QUERY_TIMEOUT = 120  # Give up on a single provider's search after 2 minutes
 PERSISTENT_REPORTS_BACKFILL_MONTHS = 6  # Try to backfill download reports six months back if possible
+DAILY_STORE_DAYS = 90  # Keep daily download facts for the past 90 days in the local store
+DAILY_STORE_MAX_MISSING = 3  # If more than 3 days are missing from the local store, search the whole span in ES instead
+DEFAULT_FILTERS = "empty_ua,no_query"
+PODLING_PREFIX = "incubator/"  # Podlings can be looked up as e.g. incubator/ponymail, as the UI suggests
+WHOLE_DAYS = re.compile(r"^now-(\d+)d/d$")  # Date math for whole days up until now, see whole_days
+STATS_VIEWS = ("summary", "countries", "daily_totals")  # Pre-reduced views of download stats, see summarize_stats
+SUMMARY_TOP = 10  # Number of top artifacts, countries and user agents to list in the summary view
+PAGED_QUERY_CONCURRENCY = 2  # Max number of artifact pages to search at the same time, per provider search
+DEFAULT_SCAN_WORKERS = 4  # Number of scan jobs to run at the same time
+DEFAULT_SCAN_BATCH_SIZE = 10  # Number of projects to find the top artifacts of in one go when scanning monthly reports (1 = no batching)
+BATCH_QUERY_TIMEOUT = 600  # Give up on a single provider's batch search after 10 minutes
+SCAN_STATE_FILE = "scan_state.json"  # Where to keep track of scanner progress, inside the data dir
+INTERACTIVE_SEARCHES = 8  # Max number of provider searches for interactive requests to run at the same time
+BACKGROUND_SEARCHES = 2  # Max number of provider searches for scans and cache refreshes to run at the same time
+INTERACTIVE_MAX_QUEUED = 32  # Turn away interactive requests if this many provider searches are already waiting
+INTERACTIVE_MAX_WAIT = 10  # Turn away interactive requests that cannot start searching within 10 seconds
+OVERLOAD_RETRY_AFTER = 30  # Ask turned away clients to try again in 30 seconds
+PRIORITY_CURRENT_MONTH = 0  # Scan job priorities, lowest goes first
+PRIORITY_DAILY_STORE = 1
+PRIORITY_BACKFILL = 1  # Plus the number of months to go back
 
 INTERNAL_AGENTS = {
     "Windows Package Manager": ("winget-cli", "Microsoft-Delivery-Optimization", "WindowsPackageManager", "Microsoft BITS",),
@@ -56,6 +86,22 @@ IGNORED_IPS = (
     '93.159.231.13',  # Kaspersky Labs, testing binaries
 )
 
+# A queued scan job. Jobs are run in order of priority, then in the order projects are listed.
+# A month_offset of None means filling the daily store, otherwise the monthly report (YYYY-MM) that many months back.
+# Batched monthly report jobs list all the projects to search for together in batch, with project being the first.
+ScanJob = collections.namedtuple(
+    "ScanJob",
+    (
+        "priority",
+        "sequence",
+        "project",
+        "month_offset",
+        "month",
+        "batch",
+    ),
+    defaults=(None,),
+)
+
 # Different indices have different field names, account for it here:
 FIELD_NAMES = {
     "fastly": { # the index prefix
@@ -82,11 +128,30 @@ FIELD_NAMES = {
 
 dataurl = "http://localhost:9200"
 datadir = None  # Where to store persistent data
+cache_size = DOWNLOADS_CACHE_SIZE
+scan_workers = DEFAULT_SCAN_WORKERS
+scan_batch_size = DEFAULT_SCAN_BATCH_SIZE
+interactive_searches = INTERACTIVE_SEARCHES
+background_searches = BACKGROUND_SEARCHES
 if hasattr(config.reporting, "downloads"):  # If prod...
     dataurl = config.reporting.downloads["dataurl"]
     datadir = config.reporting.downloads.get("datadir")
+    cache_size = config.reporting.downloads.get("cache_size", DOWNLOADS_CACHE_SIZE)
+    scan_workers = config.reporting.downloads.get("scan_workers", DEFAULT_SCAN_WORKERS)
+    scan_batch_size = config.reporting.downloads.get("scan_batch_size", DEFAULT_SCAN_BATCH_SIZE)
+    interactive_searches = config.reporting.downloads.get("interactive_searches", INTERACTIVE_SEARCHES)
+    background_searches = config.reporting.downloads.get("background_searches", BACKGROUND_SEARCHES)
 
 es_client = elasticsearch.AsyncElasticsearch(hosts=[dataurl], timeout=45)
+# Interactive requests and background work (scans, cache refreshes) share es_client, so provider searches
+# are admitted through separate budgets, with background work yielding to interactive work.
+search_admission = admission.AdmissionController(
+    interactive_limit=interactive_searches,
+    background_limit=background_searches,
+    max_queued=INTERACTIVE_MAX_QUEUED,
+    max_wait=INTERACTIVE_MAX_WAIT,
+    retry_after=OVERLOAD_RETRY_AFTER,
+)
 
 if datadir:
     if not os.path.exists(datadir):
@@ -96,25 +161,108 @@ if datadir:
         except OSError as e:
             print(f"Could not set up data directory {datadir}, will not store persistent download stats!")
 
-# WARNING: whilst operations on lists are generally thread-safe, this cache is not,
-# because updating the cache requires several operations which are not currently protected by a lock.
-# However, it appears that access to instances of this code are single-threaded by hypercorn,
-# so the lack of thread safety should not be a problem.
-downloads_data_cache = []
+# User agent classifications are stored on disk, if possible, as they rarely change
+ua_classifier = useragents.UserAgentClassifier(
+    INTERNAL_AGENTS, db_filepath=os.path.join(datadir, "useragents.db") if datadir and os.path.isdir(datadir) else None
+)
+# Daily download facts for completed days, so we only need to ask ES for today's numbers
+daily_store = None
+report_store = None
+download_index = None  # ASF-wide totals and top artifacts per month, updated as monthly reports are written
+if datadir and os.path.isdir(datadir):
+    daily_store = downloadstore.DailyDownloadStore(os.path.join(datadir, "downloads.db"))
+    report_store = reportstore.ReportStore(datadir)
+    download_index = downloadindex.DownloadIndex(datadir)
 
-async def make_query(provider, field_names, project, duration, filters, max_hits=MAX_HITS, max_ua=MAX_HITS_UA, downscaled=False):
-    q = elasticsearch_dsl.Search(using=es_client)
+# WARNING: this cache is not thread-safe, as updating it requires several operations which are not
+# protected by a lock. However, it appears that access to instances of this code are single-threaded
+# by hypercorn, so the lack of thread safety should not be a problem.
+downloads_data_cache = datacache.DataCache(
+    max_bytes=config.text_to_int(cache_size),
+    ttl=DOWNLOADS_CACHE_TTL,
+    stale_ttl=DOWNLOADS_CACHE_STALE_TTL,
+    track_requests=True,
+)
+# Searches that found nothing are cached separately, and only briefly, so they neither push out real results
+# nor get refreshed as popular searches, but repeating them does not cause another search either.
+downloads_negative_cache = datacache.DataCache(
+    max_bytes=config.text_to_int(DOWNLOADS_NEGATIVE_CACHE_SIZE), ttl=DOWNLOADS_NEGATIVE_CACHE_TTL
+)
+known_projects: set = set()  # Projects and podlings in the projects list, refreshed by downloads_scan_loop
+downloads_inflight = datacache.SingleFlight()  # Identical queries that are currently running
+inflight_priorities: dict = {}  # cache key -> admission.SharedPriority of the query running for it
+query_templates: dict = {}  # (builder, provider, filters, fixed args, variables) -> QueryTemplate
+query_bucket_limits: dict = {}  # project -> max artifacts x days to aggregate in one search, learned from ES errors
+scan_state: dict = {}  # "project/YYYY-MM" -> when the monthly report was last written
+scan_progress: dict = {"queued": 0, "completed": 0, "failed": 0, "started": 0, "finished": 0}
+cache_warming: dict = {"rounds": 0, "refreshed": 0, "failed": 0}
+
+
+def is_known_project(project: str) -> bool:
+    """Returns True if a project (or podling) is in the list of projects, or if that list is not available.
+    Podlings may also be given with their incubator/ prefix, e.g. incubator/ponymail."""
+    project = project.removeprefix(PODLING_PREFIX)
+    if not known_projects:
+        return bool(reportstore.VALID_PROJECT.match(project))
+    return project in known_projects
+
+
+def normalize_filters(filters: str) -> str:
+    """Normalizes a comma-separated list of search filters, so equivalent filter sets share a cache key"""
+    return ",".join(sorted(set(x.strip() for x in filters.split(",") if x.strip())))
+
+def is_too_many_buckets(e: elasticsearch.TransportError) -> bool:
+    """Returns True if a search failed because its aggregations would produce too many buckets"""
+    return isinstance(e.info, dict) and "too_many_buckets_exception" in e.info.get("error", {}).get("caused_by", {}).get("type", "")
+
+
+def whole_days(duration: int) -> str:
+    """Returns the date math for the past [duration] whole UTC days plus today so far, the same span that
+    query_provider_daily covers from the daily store, e.g. now-7d/d"""
+    return f"now-{duration}d/d"
+
+
+def span_in_days(duration) -> int:
+    """Returns the (max) number of days covered by a search duration"""
+    if isinstance(duration, int):
+        return duration
+    match = WHOLE_DAYS.match(duration)
+    if match:  # Whole days, plus today
+        return int(match.group(1)) + 1
+    if duration.endswith("||/d"):  # A single day, see day_query
+        return 1
+    return 31  # Whole month math, e.g. now-1M/M
+
+
+def time_range(duration) -> dict:
+    """Returns the timestamp range to search for a duration"""
+    if isinstance(duration, str) and WHOLE_DAYS.match(duration):  # Whole days up until now, e.g. now-7d/d
+        return {"gte": duration}
     if isinstance(duration, str) and "-" in duration:  # Whole month math, e.g. now-1M/M for this month only
-        q = q.filter("range", **{field_names["timestamp"]: {"gte": duration, "lte": duration}})
-    else:
-        q = q.filter("range", **{field_names["timestamp"]: {"gte": f"now-{duration}d"}})
+        return {"gte": duration, "lte": duration}
+    return {"gte": f"now-{duration}d"}
+
+
+def project_queries(field_names, project) -> list:
+    """Returns the queries matching the downloads of a project, for both TLP and podling download locations.
+    It may be TLP now, it may be Podling, it may have graduated somewhere in between."""
+    return [
+        elasticsearch_dsl.Q("prefix", **{field_names["uri"] + ".keyword": f"/{project}/"}),
+        elasticsearch_dsl.Q("prefix", **{field_names["uri"] + ".keyword": f"/incubator/{project}/"}),
+    ]
+
+
+def base_search(field_names, projects, timespan, filters) -> elasticsearch_dsl.Search:
+    """Returns a search for all downloads of a project (or a list of projects) in the given time range,
+    without any aggregations"""
+    q = elasticsearch_dsl.Search(using=es_client)
+    q = q.filter("range", **{field_names["timestamp"]: timespan})
     q = q.filter("match", **{field_names["request_method"]: "GET"})
     q = q.filter("range", bytes={"gt": 5000}) # this filters out hashes and (most?) sigs
-    # Query project for both TLP and podling download locations. It may be TLP now, it may be Podling,
-    # it may have graduated somewhere in between.
-    query_tlp = elasticsearch_dsl.Q("prefix", **{field_names["uri"] + ".keyword": f"/{project}/"})
-    query_podling = elasticsearch_dsl.Q("prefix", **{field_names["uri"] + ".keyword": f"/incubator/{project}/"})
-    q = q.query(elasticsearch_dsl.query.Bool(should=[query_tlp, query_podling], minimum_should_match=1))
+    if isinstance(projects, str):
+        projects = [projects]
+    should = [query for project in projects for query in project_queries(field_names, project)]
+    q = q.query(elasticsearch_dsl.query.Bool(should=should, minimum_should_match=1))
 
     q = q.filter("match", **{field_names["vhost"]: field_names["_vhost_"]})
 
@@ -130,10 +278,25 @@ async def make_query(provider, field_names, project, duration, filters, max_hits
     # TODO: Make this not extremely slow. For now, we'll filter in post.
     #if "no_query" in filters:  # Don't show results with query strings in them
     #    q = q.exclude("wildcard", **{field_names["uri"]+".keyword": "*="})
+    return q
+
 
-    # Bucket sorting by most downloaded items
-    main_bucket = q.aggs.bucket(
-        "most_downloads", elasticsearch_dsl.A("terms", field=f"{field_names['uri']}.keyword", size=max_hits)
+def add_top_artifacts_aggs(parent, field_names, max_hits):
+    """Adds the light aggregations finding the top artifacts by downloads (most_downloads) and by traffic
+    (most_traffic) to a search's aggregations, or to a bucket aggregation. Only the artifact names are
+    collected, the per-artifact details are searched afterwards for the union of both (see add_artifact_aggs)."""
+    parent.bucket("most_downloads", "terms", field=f"{field_names['uri']}.keyword", size=max_hits)
+    parent.bucket(
+        "most_traffic", "terms", field=f"{field_names['uri']}.keyword", size=max_hits, order={"bytes_sum": "desc"}
+    ).metric("bytes_sum", "sum", field=field_names["bytes"])
+
+
+def add_artifact_aggs(parent, field_names, max_hits, max_ua, include):
+    """Adds the per-artifact aggregation tree (artifacts) for a list of artifacts to a search's aggregations, or to
+    a bucket aggregation. The user agents, daily hits, bytes, unique IPs and countries are aggregated once per
+    artifact, no matter whether it is a top artifact by downloads, by traffic, or both."""
+    main_bucket = parent.bucket(
+        "artifacts", elasticsearch_dsl.A("terms", field=f"{field_names['uri']}.keyword", size=max_hits, include=include)
     )
     main_bucket.metric("useragents", "terms", field=field_names["useragent"]+".keyword", size=max_ua)
     main_bucket.bucket("per_day", "date_histogram", interval="day", field=field_names["timestamp"]
@@ -145,48 +308,554 @@ async def make_query(provider, field_names, project, duration, filters, max_hits
         "cca2", "terms", field=field_names["geo_country"] + ".keyword"
     )
 
-    # Bucket sorting by most bytes downloaded (may differ from most downloads top 60!)
-    main_bucket = q.aggs.bucket(
-        "most_traffic", elasticsearch_dsl.A("terms", field=f"{field_names['uri']}.keyword", size=max_hits, order={"bytes_sum": "desc"})
+
+def add_per_project_bucket(q: elasticsearch_dsl.Search, field_names, projects):
+    """Adds a bucket aggregation (per_project) splitting the downloads of a search by project, for both TLP and
+    podling locations, and returns it, so the same aggregations can be added for each project."""
+    return q.aggs.bucket(
+        "per_project",
+        "filters",
+        filters={
+            project: elasticsearch_dsl.query.Bool(should=project_queries(field_names, project), minimum_should_match=1)
+            for project in projects
+        },
     )
-    main_bucket.metric("useragents", "terms", field=field_names["useragent"]+".keyword", size=max_ua)
-    main_bucket.metric(
-        "bytes_sum", "sum", field=field_names["bytes"]
-    ).bucket("per_day", "date_histogram", interval="day", field=field_names["timestamp"]
-    ).metric(
-        "bytes_sum", "sum", field=field_names["bytes"]
-    ).metric(
-        "unique_ips", "cardinality", field="client_ip.keyword"
-    ).metric(
-        "cca2", "terms", field=field_names["geo_country"] + ".keyword"
+
+
+def top_artifacts_query_body(field_names, filters, project, timespan, max_hits) -> dict:
+    """Search body for only the names of the top artifacts of a project, by downloads and by traffic"""
+    q = base_search(field_names, project, timespan, filters)
+    add_top_artifacts_aggs(q.aggs, field_names, max_hits)
+    return q.to_dict()
+
+
+def artifact_details_query_body(field_names, filters, project, timespan, max_hits, max_ua, include) -> dict:
+    """Search body for the details of a list of artifacts of a project"""
+    q = base_search(field_names, project, timespan, filters)
+    add_artifact_aggs(q.aggs, field_names, max_hits, max_ua, include)
+    return q.to_dict()
+
+
+def batch_top_artifacts_query_body(field_names, filters, projects, timespan, max_hits) -> dict:
+    """Search body for the names of the top artifacts of several projects at once, by downloads and by traffic.
+    The downloads of all the projects are searched together, and bucketed per project before aggregating."""
+    q = base_search(field_names, projects, timespan, filters)
+    add_top_artifacts_aggs(add_per_project_bucket(q, field_names, projects), field_names, max_hits)
+    return q.to_dict()
+
+
+def query_body(builder: typing.Callable[..., dict], provider, field_names, filters, *fixed, **variables) -> dict:
+    """Returns a search body from one of the builders above. Building a search with elasticsearch_dsl is
+    fairly expensive, and only the project, time range and sizes vary between searches, so each builder is
+    only run once per provider, filter set and fixed arguments, and the result is kept as a template."""
+    filters = normalize_filters(filters)
+    template_key = (builder.__name__, provider, filters, fixed, tuple(variables))
+    template = query_templates.get(template_key)
+    if template is None:
+        template = querytemplate.QueryTemplate(
+            functools.partial(builder, field_names, filters, *fixed), variables.keys()
+        )
+        query_templates[template_key] = template
+    return template.render(**variables)
+
+
+def top_artifacts(top_aggs: dict) -> list:
+    """Returns the union of the top artifacts by downloads and by traffic, in the order they were found"""
+    return list(dict.fromkeys(bucket["key"] for agg in top_aggs.values() for bucket in agg["buckets"]))
+
+
+def merge_artifact_details(top_aggs: dict, details: dict) -> dict:
+    """Builds a search response with the top artifacts by downloads and by traffic, as found by the light search,
+    each with its artifact details. An artifact in both lists shares the same details bucket."""
+    return {
+        "aggregations": {
+            methodology: {"buckets": [details[bucket["key"]] for bucket in agg["buckets"] if bucket["key"] in details]}
+            for methodology, agg in top_aggs.items()
+        }
+    }
+
+
+async def make_query(provider, field_names, project, duration, filters, max_hits=MAX_HITS, max_ua=MAX_HITS_UA):
+    """Searches a provider for the top artifacts of a project, by downloads and by traffic, in two steps: First, a
+    light search finds the top artifacts by downloads and by traffic, then the per-artifact details are searched
+    for the union of those (see query_artifact_details). Returns a response with most_downloads and most_traffic
+    artifact buckets."""
+    body = query_body(
+        top_artifacts_query_body, provider, field_names, filters,
+        project=project, timespan=time_range(duration), max_hits=max_hits,
     )
-    try:
-        resp = await es_client.search(index=f"{provider}-*", body=q.to_dict(), size=0, timeout="60s")
-        if downscaled and resp:
-            resp["downscaled"] = True
+    resp = await es_client.search(index=f"{provider}-*", body=body, size=0, timeout="60s")
+    if "aggregations" not in resp:
         return resp
+    page_limiter = asyncio.Semaphore(PAGED_QUERY_CONCURRENCY)
+    return await query_artifact_details(
+        provider, field_names, project, duration, filters, resp["aggregations"], max_ua, page_limiter
+    )
+
+
+async def query_artifact_details(provider, field_names, project, duration, filters, top_aggs, max_ua, page_limiter):
+    """Searches the per-artifact details for the top artifacts of a project, as found by the light search, and
+    returns them merged into a response in the same format as make_query returns. If the details would produce
+    too many buckets for ES, the artifacts are searched in pages instead (see query_artifact_page). The largest
+    page size that worked is remembered per project, so subsequent searches go straight to paging."""
+    artifacts = top_artifacts(top_aggs)
+    bucket_limit = query_bucket_limits.get(project)
+    page_size = max(1, len(artifacts) if bucket_limit is None else bucket_limit // span_in_days(duration))
+    pages = await asyncio.gather(
+        *[
+            query_artifact_page(
+                provider, field_names, project, duration, filters, artifacts[i:i+page_size], max_ua, page_limiter
+            )
+            for i in range(0, len(artifacts), page_size)
+        ]
+    )
+    return merge_artifact_details(top_aggs, {bucket["key"]: bucket for page in pages for bucket in page})
+
+
+async def query_artifact_page(provider, field_names, project, duration, filters, artifacts, max_ua, page_limiter):
+    """Searches the per-artifact details for a page of artifacts. If that is too many buckets, the page
+    is split in two, and the smaller page size is remembered for this project."""
+    body = query_body(
+        artifact_details_query_body, provider, field_names, filters,
+        project=project, timespan=time_range(duration), max_hits=len(artifacts), max_ua=max_ua, include=artifacts,
+    )
+    try:
+        async with page_limiter:
+            resp = await es_client.search(index=f"{provider}-*", body=body, size=0, timeout="60s")
+        return resp["aggregations"]["artifacts"]["buckets"]
     except elasticsearch.TransportError as e:
-        # If too many buckets for us to handle, downscale the UA search
-        if isinstance(e.info, dict) and 'too_many_buckets_exception' in e.info["error"].get("caused_by", {}).get("type", ""):
-            max_ua = int(max_ua*0.67)
-            max_hits = int(max_hits*0.67)
-            print(f"Too many buckets for {project}, downscaling query by 33%")
-            if max_ua > 2:
-                return await make_query(provider, field_names, project, duration, filters, max_hits, max_ua, True)
-    return {"downscaled": downscaled}
+        if not is_too_many_buckets(e) or len(artifacts) == 1:
+            raise
+    half = len(artifacts) // 2
+    bucket_limit = half * span_in_days(duration)
+    query_bucket_limits[project] = min(query_bucket_limits.get(project, bucket_limit), bucket_limit)
+    print(f"Download stats: Too many buckets for {project}, reducing pages to {half} artifacts")
+    first_half = await query_artifact_page(
+        provider, field_names, project, duration, filters, artifacts[:half], max_ua, page_limiter
+    )
+    second_half = await query_artifact_page(
+        provider, field_names, project, duration, filters, artifacts[half:], max_ua, page_limiter
+    )
+    return first_half + second_half
 
 
-async def generate_stats(project: str, duration: str, filters: str="empty_ua,no_query"):
-    original_duration = duration
+async def query_provider(provider, field_names, project, duration, filters):
+    """Runs the download stats search for a single provider. Timeouts and errors are contained to the
+    provider in question, so one slow or failing index does not hold back or break the entire search.
+    Returns None if the provider could not be queried. Raises admission.Overloaded if the search could not
+    be admitted in time."""
+    try:
+        async with search_admission.admit():
+            return await asyncio.wait_for(
+                make_query(provider, field_names, project, duration, filters), timeout=PROVIDER_QUERY_TIMEOUT
+            )
+    except asyncio.TimeoutError:
+        print(f"Download stats: {provider} search for {project} timed out after {PROVIDER_QUERY_TIMEOUT} seconds")
+    except elasticsearch.ElasticsearchException as e:
+        print(f"Download stats: {provider} search for {project} failed: {e}")
+    return None
+
+
+async def make_batch_query(provider, field_names, projects, duration, filters, max_hits=MAX_HITS, max_ua=MAX_HITS_UA):
+    """Searches a provider for the top artifacts of several projects, returning a dict of project -> response, each
+    in the same format as make_query returns. Only the light search for the top artifacts is run for all the
+    projects at once: its buckets are few (projects x max_hits, twice), whereas the per-artifact details of a
+    whole batch would be far more than ES allows in one search. The details are then searched per project, paged
+    by the bucket limits learned for that project, as make_query does. If the light search would produce too many
+    buckets for ES after all, the batch is split in two, and a single project is searched on its own."""
+    if len(projects) == 1:
+        return {projects[0]: await make_query(provider, field_names, projects[0], duration, filters, max_hits, max_ua)}
+    # The batch body varies with the list of projects, so it is not worth keeping as a template
+    body = batch_top_artifacts_query_body(field_names, normalize_filters(filters), projects, time_range(duration), max_hits)
+    try:
+        resp = await es_client.search(
+            index=f"{provider}-*", body=body, size=0, timeout=f"{BATCH_QUERY_TIMEOUT//2}s", request_timeout=BATCH_QUERY_TIMEOUT
+        )
+    except elasticsearch.TransportError as e:
+        if not is_too_many_buckets(e):
+            raise
+        half = len(projects) // 2
+        print(f"Download stats: Too many buckets for a batch of {len(projects)} projects, splitting it in two")
+        first_half = await make_batch_query(provider, field_names, projects[:half], duration, filters, max_hits, max_ua)
+        second_half = await make_batch_query(provider, field_names, projects[half:], duration, filters, max_hits, max_ua)
+        return {**first_half, **second_half}
+    per_project = resp.get("aggregations", {}).get("per_project", {}).get("buckets", {})
+    # The details of all the projects share the same page concurrency as a single project search
+    page_limiter = asyncio.Semaphore(PAGED_QUERY_CONCURRENCY)
+    found = [project for project in projects if project in per_project]
+    responses = await asyncio.gather(
+        *[
+            query_artifact_details(
+                provider, field_names, project, duration, filters,
+                {methodology: per_project[project][methodology] for methodology in ("most_downloads", "most_traffic")},
+                max_ua, page_limiter,
+            )
+            for project in found
+        ]
+    )
+    found_responses = dict(zip(found, responses))
+    return {project: found_responses.get(project, {}) for project in projects}
+
+
+async def query_provider_batch(provider, field_names, projects, duration, filters) -> dict:
+    """Runs the download stats search for several projects for a single provider, see make_batch_query.
+    Timeouts and errors are contained to the provider in question. Returns a dict of project -> response,
+    where the response is None if the provider could not be queried."""
+    try:
+        async with search_admission.admit():
+            return await asyncio.wait_for(
+                make_batch_query(provider, field_names, projects, duration, filters), timeout=BATCH_QUERY_TIMEOUT
+            )
+    except asyncio.TimeoutError:
+        print(f"Download stats: {provider} batch search for {len(projects)} projects timed out after {BATCH_QUERY_TIMEOUT} seconds")
+    except elasticsearch.ElasticsearchException as e:
+        print(f"Download stats: {provider} batch search for {len(projects)} projects failed: {e}")
+    return {project: None for project in projects}
+
+
+def parse_duration(duration):
+    """Returns a search duration as a whole number of days (from e.g. 7 or "7d"), or as whole month math
+    (e.g. now-1M/M) as-is. Raises a ValueError for anything else."""
     if isinstance(duration, str) and "M/M" not in duration:
-        if duration.endswith("d"):
-            duration = duration[:-1]
         try:
-            duration = int(duration)
+            return int(duration.removesuffix("d"))
         except ValueError:
-            return {"success": False, "message": "Invalid duration window! Please specify a whole number of days"}
+            raise ValueError("Invalid duration window! Please specify a whole number of days") from None
+    return duration
+
+
+async def generate_stats(project: str, duration: str, filters: str=DEFAULT_FILTERS, allow_stale: bool = True):
+    """Returns the download stats for a project over a duration (whole days, or whole month math), as a tuple of
+    the per-artifact stats, the query parameters, and the pre-reduced views of the stats (see summarize_stats).
+    Expired results are served while they are refreshed, unless allow_stale is False, as for the scanner, which
+    keeps what it gets as the monthly report. Raises a ValueError for an invalid duration, see parse_duration."""
+    original_duration = duration
+    duration = parse_duration(duration)
+
+    # Check if we have a cached result. If it has expired, serve it anyway, and refresh it in the background.
+    cache_key = (project, duration, normalize_filters(filters))
+    cached_item = downloads_negative_cache.get(cache_key)
+    if cached_item:
+        return cached_item
+    if allow_stale:
+        cached_item, stale = downloads_data_cache.get_stale(cache_key)
+    else:
+        cached_item, stale = downloads_data_cache.get(cache_key), False
+    if cached_item:
+        if stale:
+            refresh_stats(cache_key)
+        return cached_item
+    # Not cached, run the query. If an identical query is already running, wait for that one to finish instead.
+    priority = inflight_priority(cache_key, admission.current_priority.get())
+    return await downloads_inflight.run(
+        cache_key, query_stats_shared, priority, cache_key, project, duration, original_duration, filters
+    )
 
-    downloaded_artifacts = {}
+
+def refresh_stats(cache_key: tuple) -> asyncio.Future:
+    """Starts refreshing the download stats for a cache key in the background, unless that is already in
+    progress, and returns the running task"""
+    project, duration, filters = cache_key
+    priority = inflight_priority(cache_key, admission.BACKGROUND)
+    return downloads_inflight.start(
+        cache_key, query_stats_shared, priority, cache_key, project, duration, duration, filters
+    )
+
+
+def inflight_priority(cache_key: tuple, priority) -> admission.SharedPriority:
+    """Returns the priority to query the stats for a cache key at. If a query for it is already running, that
+    query is joined, so its priority is raised to ours if need be: An interactive request joining a background
+    refresh would otherwise wait behind all interactive work, without ever being turned away."""
+    if isinstance(priority, admission.SharedPriority):
+        priority = priority.priority
+    shared = inflight_priorities.get(cache_key)
+    if shared is None:
+        shared = inflight_priorities[cache_key] = admission.SharedPriority(priority)
+    else:
+        shared.raise_to(priority)
+    return shared
+
+
+async def query_stats_shared(priority: admission.SharedPriority, cache_key: tuple, *args):
+    """Runs query_stats at a priority shared with everyone waiting for it, see inflight_priority"""
+    admission.current_priority.set(priority)  # Only applies to this task
+    try:
+        return await query_stats(cache_key, *args)
+    finally:
+        if inflight_priorities.get(cache_key) is priority:
+            del inflight_priorities[cache_key]
+
+
+async def downloads_cache_warm_loop():
+    """Keeps the most requested download stats fresh, by refreshing them shortly before they expire, so
+    popular searches are answered from the cache instead of waiting for ES"""
+    admission.current_priority.set(admission.BACKGROUND)
+    while True:
+        await asyncio.sleep(DOWNLOADS_CACHE_WARM_INTERVAL)
+        # Anything expiring before the next round is refreshed now, one at a time, to go easy on ES
+        for cache_key in downloads_data_cache.expiring(DOWNLOADS_CACHE_WARM_INTERVAL * 2, DOWNLOADS_CACHE_WARM_KEYS):
+            try:
+                await refresh_stats(cache_key)
+                cache_warming["refreshed"] += 1
+            # One bad refresh should not stop the others, whatever went wrong: ES, the daily store, or the data
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                cache_warming["failed"] += 1
+                print(f"Download stats: Could not refresh cached stats for {cache_key}: {e}")
+        downloads_data_cache.decay_requests()
+        cache_warming["rounds"] += 1
+
+
+def stats_as_json(stats: dict) -> dict:
+    """Returns a JSON-serializable copy of download stats, converting the packed daily stats arrays to lists"""
+    return {
+        url: dict(entry, daily_stats=entry["daily_stats"].tolist())
+        if isinstance(entry.get("daily_stats"), numpy.ndarray)
+        else entry
+        for url, entry in stats.items()
+    }
+
+
+def day_query(day: int) -> str:
+    """Returns the whole-day search range for a UTC day epoch, e.g. 2024-05-01||/d"""
+    return time.strftime("%Y-%m-%d||/d", time.gmtime(day))
+
+
+def response_to_daily_records(resp: dict) -> typing.List[downloadstore.DailyRecord]:
+    """Converts the response of a single-day download stats search into daily artifact records"""
+    records = {}
+    for methodology in ("most_downloads", "most_traffic",):
+        for entry in resp["aggregations"][methodology]["buckets"]:
+            if entry["key"] in records:  # Already seen in the other agg
+                continue
+            uas: dict = {}
+            for uaentry in entry["useragents"]["buckets"]:
+                ua_key = ua_classifier.classify(uaentry["key"])
+                uas[ua_key] = uas.get(ua_key, 0) + uaentry["doc_count"]
+            for daily_entry in entry["per_day"]["buckets"]:
+                records[entry["key"]] = downloadstore.DailyRecord(
+                    artifact=entry["key"],
+                    day=int(daily_entry["key"] / 1000),
+                    hits=int(daily_entry["doc_count"]),
+                    unique_ips=int(daily_entry["unique_ips"]["value"]),
+                    bytes=int(daily_entry["bytes_sum"]["value"]),
+                    cca2={x["key"]: x["doc_count"] for x in daily_entry["cca2"]["buckets"]},
+                    useragents=uas,
+                )
+    return list(records.values())
+
+
+def daily_records_to_response(records: typing.Iterable[downloadstore.DailyRecord], max_hits=MAX_HITS, max_ua=MAX_HITS_UA):
+    """Builds a search response, in the same format as make_query returns, from daily artifact records"""
+    artifacts: dict = {}
+    for record in records:
+        entry = artifacts.get(record.artifact)
+        if not entry:
+            entry = artifacts[record.artifact] = {
+                "key": record.artifact,
+                "doc_count": 0,
+                "bytes_sum": {"value": 0},
+                "useragents": {},
+                "per_day": {},
+            }
+        entry["doc_count"] += record.hits
+        entry["bytes_sum"]["value"] += record.bytes
+        for ua_key, ua_hits in record.useragents.items():
+            entry["useragents"][ua_key] = entry["useragents"].get(ua_key, 0) + ua_hits
+        entry["per_day"][record.day] = {
+            "key": record.day * 1000,
+            "doc_count": record.hits,
+            "bytes_sum": {"value": record.bytes},
+            "unique_ips": {"value": record.unique_ips},
+            "cca2": {"buckets": [{"key": k, "doc_count": v} for k, v in record.cca2.items()]},
+        }
+    for entry in artifacts.values():
+        top_uas = sorted(entry["useragents"].items(), key=lambda x: (-x[1], x[0]))[:max_ua]
+        entry["useragents"] = {"buckets": [{"key": k, "doc_count": v} for k, v in top_uas]}
+        entry["per_day"] = {"buckets": [entry["per_day"][day] for day in sorted(entry["per_day"])]}
+    return {
+        "aggregations": {
+            # Ties are broken by artifact name, the same way ES does it
+            "most_downloads": {
+                "buckets": sorted(artifacts.values(), key=lambda x: (-x["doc_count"], x["key"]))[:max_hits],
+            },
+            "most_traffic": {
+                "buckets": sorted(artifacts.values(), key=lambda x: (-x["bytes_sum"]["value"], x["key"]))[:max_hits],
+            },
+        },
+        "useragents_classified": True,
+    }
+
+
+async def fetch_day(provider, field_names, project, day, filters):
+    """Searches ES for a single day's download stats for a provider, returning them as daily artifact records.
+    If the day is over, the records are also added to the daily store. Returns None if the search failed."""
+    resp = await query_provider(provider, field_names, project, day_query(day), filters)
+    if resp is None:
+        return None
+    if "aggregations" not in resp:
+        return []
+    records = response_to_daily_records(resp)
+    # Only store completed days
+    if daily_store and day + 86400 <= time.time():
+        daily_store.add_day(project, provider, normalize_filters(filters), day, records)
+    return records
+
+
+async def query_provider_daily(provider, field_names, project, duration: int, filters):
+    """Runs the download stats search for a single provider over the past [duration] days. Completed days
+    are read from the daily store, so ES is only searched for today, plus any days missing from the store.
+    If too many days are missing, the whole span is searched in ES instead.
+    Returns None if the provider could not be queried."""
+    assert daily_store, "No daily store available!"
+    store_filters = normalize_filters(filters)
+    today = int(time.time()) // 86400 * 86400
+    first_day = today - duration * 86400
+    stored_days = daily_store.stored_days(project, provider, store_filters, first_day, today - 86400)
+    missing_days = [day for day in range(first_day, today, 86400) if day not in stored_days]
+    if len(missing_days) > DAILY_STORE_MAX_MISSING:  # Search ES instead, over the same whole days
+        return await query_provider(provider, field_names, project, whole_days(duration), filters)
+    fetched = await asyncio.gather(
+        *[fetch_day(provider, field_names, project, day, filters) for day in missing_days + [today]]
+    )
+    if any(records is None for records in fetched):
+        return None
+    records = daily_store.fetch(project, provider, store_filters, first_day, today - 86400)
+    for day_records in fetched:
+        records.extend(day_records)
+    return daily_records_to_response(records)
+
+
+async def fill_daily_store(project: str, filters: str = DEFAULT_FILTERS):
+    """Adds any completed days in the past DAILY_STORE_DAYS days that are missing from the daily store"""
+    assert daily_store, "No daily store available!"
+    store_filters = normalize_filters(filters)
+    today = int(time.time()) // 86400 * 86400
+    first_day = today - DAILY_STORE_DAYS * 86400
+    for provider, field_names in FIELD_NAMES.items():
+        stored_days = daily_store.stored_days(project, provider, store_filters, first_day, today - 86400)
+        for day in range(first_day, today, 86400):
+            if day not in stored_days:
+                await fetch_day(provider, field_names, project, day, filters)
+    ua_classifier.flush()
+
+
+def collate_response(project: str, filters: str, resp: dict, downloaded_artifacts: dict, epochs: list):
+    """Collates the artifact buckets of a download stats search response into the per-artifact stats dict"""
+    # User agents in responses built from the daily store have already been classified
+    classify = str if resp.get("useragents_classified") else ua_classifier.classify
+    seen = set()
+    for methodology in (
+        "most_downloads",
+        "most_traffic",
+    ):
+        for entry in resp["aggregations"][methodology]["buckets"]:
+            # An artifact in both aggs has the same details in each, so only the first one counts
+            if entry["key"] in seen:
+                continue
+            seen.add(entry["key"])
+            # url, shortened = /incubator/ponymail/foo.tar.gz -> foo.tar.gz
+            url = re.sub(r"/+", "/", entry["key"]).replace(f"/{project}/", "", 1)
+            # TODO: Address in OpenSearch later on...
+            if "no_query" in filters and "?" in url:
+                continue
+            if "." not in url or url.endswith("/") or url.endswith("KEYS"):  # Never count KEYS or non-files
+                continue
+            if url not in downloaded_artifacts:
+                downloaded_artifacts[url] = {
+                    "bytes": 0,
+                    "hits": 0,
+                    "hits_unique": 0,
+                    "cca2": {},
+                    "daily_stats": {},
+                    "useragents": {},
+                }
+            no_bytes = 0
+            no_hits = 0
+            no_hits_unique = 0
+            cca2_hits: dict = {}
+            daily_data = []
+
+            # User Agent (Browser + OS) summation
+            uas: dict = {}
+            for uaentry in entry["useragents"]["buckets"]:
+                ua_key = classify(uaentry["key"])  # the full agent string -> "OS / Agent family"
+                uas[ua_key] = uas.get(ua_key, 0) + uaentry["doc_count"]
+            for key, val in uas.items():
+                # There will be duplicate entries here, so we are going to go for the highest count found for each URL
+                downloaded_artifacts[url]["useragents"][key] = max(downloaded_artifacts[url]["useragents"].get(key, 0), val)
+
+            for daily_entry in entry["per_day"]["buckets"]:
+                day_ts = int(daily_entry["key"] / 1000)
+                epochs.append(day_ts)
+                nb_daily = int(daily_entry["bytes_sum"]["value"])
+                nh_daily = int(daily_entry["doc_count"])
+                no_bytes += nb_daily
+
+                visits_unique = int(daily_entry["unique_ips"]["value"])
+                no_hits += nh_daily
+                no_hits_unique += visits_unique
+
+                for ccaentry in daily_entry["cca2"]["buckets"]:
+                    cca2 = ccaentry["key"]
+                    cca2_count = ccaentry["doc_count"]
+                    if cca2 and cca2 != "-":
+                        cca2_hits[cca2] = cca2_hits.get(cca2, 0) + cca2_count
+                daily_data.append((day_ts, nh_daily, visits_unique, nb_daily))
+            # Daily stats are kept as one packed (days x 4) integer array rather than lists of lists, to save memory
+            # in the cache. They are converted back into lists when served, see stats_as_json.
+            # ndmin=2 rather than reshape, which would return a view that does not own (nor size up as) its data.
+            daily_stats = numpy.array(daily_data or numpy.empty((0, 4)), dtype=numpy.int64, ndmin=2)
+
+            # The prevailing agg (most hits or most traffic) wins
+            if no_bytes > downloaded_artifacts[url]["bytes"]:
+                downloaded_artifacts[url]["bytes"] += no_bytes
+                downloaded_artifacts[url]["daily_stats"] = daily_stats
+            if no_hits > downloaded_artifacts[url]["hits"]:
+                downloaded_artifacts[url]["hits"] += no_hits
+                downloaded_artifacts[url]["daily_stats"] = daily_stats
+            if no_hits_unique > downloaded_artifacts[url]["hits_unique"]:
+                downloaded_artifacts[url]["hits_unique"] += no_hits_unique
+            if sum([x for x in cca2_hits.values()]) > sum([x for x in downloaded_artifacts[url]["cca2"].values()]):
+                downloaded_artifacts[url]["cca2"] = cca2_hits
+
+
+async def query_stats(cache_key: tuple, project: str, duration, original_duration, filters: str):
+    """Queries all providers for download stats and collates the results, adding them to the cache"""
+    # Query all providers at once, then collate the results in the order they are listed in FIELD_NAMES.
+    # Searches spanning a number of days can mostly be answered from the daily store, if we have one.
+    query_func = query_provider_daily if daily_store and isinstance(duration, int) else query_provider
+    responses = await asyncio.gather(
+        *[query_func(provider, field_names, project, duration, filters) for provider, field_names in FIELD_NAMES.items()]
+    )
+    stats = collate_stats(cache_key, project, original_duration, filters, responses)
+    ua_classifier.flush()  # Store any newly seen user agents on disk
+    return stats
+
+
+async def query_stats_batch(projects: typing.Sequence[str], duration: str, filters: str = DEFAULT_FILTERS) -> dict:
+    """Queries all providers for the download stats of several projects at once, with one search for the top
+    artifacts per provider rather than one per project and provider (see make_batch_query). The results are
+    collated and cached per project, just as generate_stats would, and returned as a dict of
+    project -> (stats, query parameters, views)."""
+    provider_responses = await asyncio.gather(
+        *[
+            query_provider_batch(provider, field_names, projects, duration, filters)
+            for provider, field_names in FIELD_NAMES.items()
+        ]
+    )
+    results = {}
+    for project in projects:
+        cache_key = (project, duration, normalize_filters(filters))
+        responses = [per_project[project] for per_project in provider_responses]
+        results[project] = collate_stats(cache_key, project, duration, filters, responses)
+    ua_classifier.flush()  # Store any newly seen user agents on disk
+    return results
+
+
+def collate_stats(cache_key: tuple, project: str, original_duration, filters: str, responses: list):
+    """Collates the search responses of all providers (in the order of FIELD_NAMES, None for providers that
+    could not be queried) into download stats, adding them to the cache"""
+    downloaded_artifacts: dict = {}
     query_parameters = {
         "filters": filters,
         "timespan": original_duration,
@@ -196,136 +865,190 @@ async def generate_stats(project: str, duration: str, filters: str="empty_ua,no_
         "max_hits": MAX_HITS,
         "max_hits_useragent": MAX_HITS_UA,
     }
+    epochs: list = []
+    providers_unavailable = [provider for provider, resp in zip(FIELD_NAMES, responses) if resp is None]
+    for resp in responses:
+        if not resp or "aggregations" not in resp:  # Skip this provider if no data is available
+            continue
+        collate_response(project, filters, resp, downloaded_artifacts, epochs)
+
+    if epochs:
+        min_epoch = time.strftime("%Y-%m-%d 00:00:00", time.gmtime(min(epochs)))
+        max_epoch = time.strftime("%Y-%m-%d 23:59:59", time.gmtime(max(epochs)))
+        query_parameters["timespan"] = f"{min_epoch} (UTC) -> {max_epoch} (UTC)"
+    # The views are computed once here, and cached alongside the stats they were reduced from
+    entry = (downloaded_artifacts, query_parameters, summarize_stats(downloaded_artifacts))
+    downloads_negative_cache.delete(cache_key)
+    if providers_unavailable:  # Partial results, only cache them briefly
+        query_parameters["providers_unavailable"] = providers_unavailable
+        downloads_data_cache.set(cache_key, entry, ttl=DOWNLOADS_CACHE_TTL_PARTIAL)
+    elif not downloaded_artifacts:
+        downloads_data_cache.delete(cache_key)  # In case the downloads went away since last time
+        downloads_negative_cache.set(cache_key, entry)
+    else:
+        downloads_data_cache.set(cache_key, entry)
+
+    return entry
+
+
+def summarize_stats(stats: dict) -> dict:
+    """Reduces per-artifact download stats to the smaller views that overview pages need, keyed by view:
+    summary: Totals, and the top artifacts, countries and user agents
+    countries: Downloads per country, across all artifacts
+    daily_totals: Daily stats 4-tuples, summed across all artifacts"""
+    countries: collections.Counter = collections.Counter()
+    ua_totals: collections.Counter = collections.Counter()
+    for entry in stats.values():
+        countries.update(entry["cca2"])
+        ua_totals.update(entry["useragents"])
+    daily_stats = [entry["daily_stats"] for entry in stats.values() if len(entry["daily_stats"])]
+    daily_totals: list = []
+    if daily_stats:
+        all_days = numpy.concatenate(daily_stats)
+        days, day_index = numpy.unique(all_days[:, 0], return_inverse=True)
+        sums = numpy.zeros((len(days), 3), dtype=numpy.int64)
+        numpy.add.at(sums, day_index, all_days[:, 1:])
+        daily_totals = numpy.column_stack((days, sums)).tolist()
+    top_entries = sorted(stats.items(), key=lambda x: (-x[1]["hits"], x[0]))[:SUMMARY_TOP]
+    return {
+        "summary": {
+            "artifacts": len(stats),
+            "hits": sum(entry["hits"] for entry in stats.values()),
+            "hits_unique": sum(entry["hits_unique"] for entry in stats.values()),
+            "bytes": sum(entry["bytes"] for entry in stats.values()),
+            "top_artifacts": [
+                {"artifact": url, "hits": entry["hits"], "bytes": entry["bytes"]} for url, entry in top_entries
+            ],
+            "top_countries": dict(countries.most_common(SUMMARY_TOP)),
+            "top_useragents": dict(ua_totals.most_common(SUMMARY_TOP)),
+        },
+        "countries": dict(countries.most_common()),
+        "daily_totals": daily_totals,
+    }
+
+
+def load_scan_state():
+    """Loads the persisted scanner progress from disk, if present"""
+    scan_state.clear()
+    if datadir and os.path.exists(os.path.join(datadir, SCAN_STATE_FILE)):
+        try:
+            with open(os.path.join(datadir, SCAN_STATE_FILE)) as f:
+                scan_state.update(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Download stats: Could not load scan progress, starting afresh: {e}")
 
-    # Check if we have a cached result
-    cache_found = False
-    # TODO: the cache key needs to take account of form_data filters as they affect the content
-    cache_key = f"{project}-{duration}"
-    cache_timeout_ts = time.time() - DOWNLOADS_CACHE_TTL
-    epochs = []
-    for item in downloads_data_cache:  # (cache_key, cache_ts, cache_data)
-        if item[0] == cache_key and item[1] >= cache_timeout_ts:
-            cache_found = True
-            downloaded_artifacts = item[2]
-            query_parameters = item[3]
-            break
-
-    if not cache_found:
-        downscaled = False
-        for provider, field_names in FIELD_NAMES.items():
-            resp = await make_query(provider, field_names, project, duration, filters)
-            if "aggregations" not in resp:  # Skip this provider if no data is available
-                continue
-            if resp.get("downscaled"):  # Too many damn buckets
-                downscaled = True
-            for methodology in (
-                "most_downloads",
-                "most_traffic",
-            ):
-                for entry in resp["aggregations"][methodology]["buckets"]:
-                    # url, shortened = /incubator/ponymail/foo.tar.gz -> foo.tar.gz
-                    url = re.sub(r"/+", "/", entry["key"]).replace(f"/{project}/", "", 1)
-                    # TODO: Address in OpenSearch later on...
-                    if "no_query" in filters and "?" in url:
-                        continue
-                    if "." not in url or url.endswith("/") or url.endswith("KEYS"):  # Never count KEYS or non-files
-                        continue
-                    if url not in downloaded_artifacts:
-                        downloaded_artifacts[url] = {
-                            "bytes": 0,
-                            "hits": 0,
-                            "hits_unique": 0,
-                            "cca2": {},
-                            "daily_stats": {},
-                            "useragents": {},
-                        }
-                    no_bytes = 0
-                    no_hits = 0
-                    no_hits_unique = 0
-                    cca2_hits = {}
-                    daily_data = []
-
-                    # User Agent (Browser + OS) summation
-                    uas = {}
-                    for uaentry in entry["useragents"]["buckets"]:
-                        ua_agent = uaentry["key"] # the full agent string
-                        # NOTE: ua_parser will set OS and UA Family to "Other" when it doesn't recognize the UA string.
-                        ua = ua_parser.user_agent_parser.Parse(ua_agent)
-                        ua_os_family = ua.get("os", {}).get("family", "Unknown")
-                        # If OS is "Other", we'll adjust it to "Unknown" ourselves.
-                        if ua_os_family == "Other":
-                            ua_os_family = "Unknown"
-                        # UA family will typically be "Other" when unknown to the parser, we'll address this below.
-                        # If the family is empty, we'll also set to Other and adjust later on.
-                        ua_agent_family = ua.get("user_agent", {}).get("family", "Other")
-                        # Adjust for various package managers we know of
-                        if ua_agent_family == "Other":
-                            for ia_key, ia_names in INTERNAL_AGENTS.items():
-                                if any(x in ua_agent for x in ia_names):
-                                    ua_agent_family = ia_key
-                                    break
-                        # If we still don't know what this is, mark as "Unknown", to distinguish from the combined "Other" chart group.
-                        if ua_agent_family == "Other":
-                            ua_agent_family = "Unknown"
-                        ua_key = ua_os_family + " / " + ua_agent_family
-                        uas[ua_key] = uas.get(ua_key, 0) + uaentry["doc_count"]
-                    for key, val in uas.items():
-                        # There will be duplicate entries here, so we are going to go for the highest count found for each URL
-                        downloaded_artifacts[url]["useragents"][key] = max(downloaded_artifacts[url]["useragents"].get(key, 0), val)
-
-                    for daily_entry in entry["per_day"]["buckets"]:
-                        day_ts = int(daily_entry["key"] / 1000)
-                        epochs.append(day_ts)
-                        nb_daily = int(daily_entry["bytes_sum"]["value"])
-                        nh_daily = int(daily_entry["doc_count"])
-                        no_bytes += nb_daily
-
-                        visits_unique = int(daily_entry["unique_ips"]["value"])
-                        no_hits += nh_daily
-                        no_hits_unique += visits_unique
-
-                        for ccaentry in daily_entry["cca2"]["buckets"]:
-                            cca2 = ccaentry["key"]
-                            cca2_count = ccaentry["doc_count"]
-                            if cca2 and cca2 != "-":
-                                cca2_hits[cca2] = cca2_hits.get(cca2, 0) + cca2_count
-                        daily_data.append([day_ts, nh_daily, visits_unique, nb_daily])
-
-                    # The prevailing agg (most hits or most traffic) wins
-                    if no_bytes > downloaded_artifacts[url]["bytes"]:
-                        downloaded_artifacts[url]["bytes"] += no_bytes
-                        downloaded_artifacts[url]["daily_stats"] = daily_data
-                    if no_hits > downloaded_artifacts[url]["hits"]:
-                        downloaded_artifacts[url]["hits"] += no_hits
-                        downloaded_artifacts[url]["daily_stats"] = daily_data
-                    if no_hits_unique > downloaded_artifacts[url]["hits_unique"]:
-                        downloaded_artifacts[url]["hits_unique"] += no_hits_unique
-                    if sum([x for x in cca2_hits.values()]) > sum([x for x in downloaded_artifacts[url]["cca2"].values()]):
-                        downloaded_artifacts[url]["cca2"] = cca2_hits
-            # Ensure all entries are properly marked if query was downscaled
-            if downscaled:
-                for key, val in downloaded_artifacts.items():
-                    val["downscaled"] = True
-
-        if epochs:
-            min_epoch = time.strftime("%Y-%m-%d 00:00:00", time.gmtime(min(epochs)))
-            max_epoch = time.strftime("%Y-%m-%d 23:59:59", time.gmtime(max(epochs)))
-            query_parameters["timespan"] = f"{min_epoch} (UTC) -> {max_epoch} (UTC)"
-        # Set cache data and cull old cache list if needed
-        new_cache_list = [item for item in downloads_data_cache if item[1] >= cache_timeout_ts]
-        downloads_data_cache.clear()
-        downloads_data_cache.extend(new_cache_list)
-        # Make sure there is room to add another entry
-        # entries are added in date order, so [0] is the oldest
-        while len(downloads_data_cache) >= DOWNLOADS_CACHE_ITEMS:
-            del downloads_data_cache[0]
-        downloads_data_cache.append((cache_key, time.time(), downloaded_artifacts, query_parameters))
-
-    return downloaded_artifacts or {}, query_parameters
+
+def save_scan_state():
+    """Persists the scanner progress to disk, atomically, so a restart picks up where we left off"""
+    if datadir:
+        state_filename = os.path.join(datadir, SCAN_STATE_FILE)
+        try:
+            with open(state_filename + ".tmp", "w") as f:
+                json.dump(scan_state, f)
+            os.replace(state_filename + ".tmp", state_filename)
+        except OSError as e:
+            print(f"Download stats: Could not save scan progress: {e}")
+
+
+def scan_jobs(project: str, sequence: int = 0) -> typing.List[ScanJob]:
+    """Returns the scan jobs needed to bring a project's persistent data up to date.
+    We want this month's report, the daily facts store, and perhaps reports for the last N months,
+    if they are outdated or missing."""
+    jobs = []
+    now = time.time()
+    if daily_store:
+        jobs.append(ScanJob(PRIORITY_DAILY_STORE, sequence, project, None, None))
+    today = datetime.datetime.utcnow()
+    for m in range(0, PERSISTENT_REPORTS_BACKFILL_MONTHS):
+        today = today.replace(day=1)  # Round down to first day of the month
+        month = f"{today.year}-{today.month:02}"
+        monthly_deadline = (today.replace(year=today.year if today.month != 12 else today.year+1, month=today.month % 12+1)).timestamp()
+        last_scanned = scan_state.get(f"{project}/{month}")
+        if last_scanned is None:  # Not tracked yet, see if we already have a report from before we tracked progress
+            last_scanned = report_store.index(project).get(month, {}).get("updated", 0) if report_store else 0
+            scan_state[f"{project}/{month}"] = last_scanned
+        # If not updated after the month was done, and not updated in the past day, schedule it
+        if last_scanned < monthly_deadline and last_scanned < now - 86400:
+            priority = PRIORITY_CURRENT_MONTH if m == 0 else PRIORITY_BACKFILL + m
+            jobs.append(ScanJob(priority, sequence, project, m, month))
+        today = today - datetime.timedelta(days=1)  # Wind clock back one month
+    return jobs
+
+
+def batch_scan_jobs(jobs: typing.List[ScanJob]) -> typing.List[ScanJob]:
+    """Combines the monthly report jobs for the same month into batches of up to scan_batch_size projects, so
+    their top artifacts can be searched for together (see query_stats_batch). Daily store jobs are kept on
+    their own."""
+    if scan_batch_size <= 1:
+        return jobs
+    batched_jobs = []
+    batchable: dict = {}  # month_offset -> jobs
+    for job in jobs:
+        if job.month_offset is None:
+            batched_jobs.append(job)
+        else:
+            batchable.setdefault(job.month_offset, []).append(job)
+    for month_jobs in batchable.values():
+        for i in range(0, len(month_jobs), scan_batch_size):
+            batch = month_jobs[i:i+scan_batch_size]
+            batched_jobs.append(batch[0]._replace(batch=tuple(job.project for job in batch)))
+    return batched_jobs
+
+
+def write_report(project: str, month: str, stats: dict, query_params: dict):
+    """Writes a monthly report to the report store, and adds its numbers to the ASF-wide download index"""
+    assert report_store, "No report store available!"
+    json_result = {
+        "query": query_params,
+        "files": stats_as_json(stats),
+    }
+    report_store.write(project, month, json_result)
+    if download_index:
+        download_index.update(project, month, json_result["files"])
+
+
+async def run_scan_job(job: ScanJob):
+    """Runs a single scan job, either filling the daily store or writing monthly report(s)"""
+    if job.month_offset is None:
+        await fill_daily_store(job.project)
+        return
+    assert report_store, "No report store available!"
+    monthly_query = f"now-{job.month_offset}M/M"  # OpenSearch whole-month query
+    # Grab scan results, write to disk. Serializing and compressing a large report takes a while, so this
+    # is done in a thread, to keep the event loop responsive.
+    if job.batch:
+        results = await query_stats_batch(job.batch, monthly_query)
+        for project, (stats, query_params, _views) in results.items():
+            await asyncio.to_thread(write_report, project, job.month, stats, query_params)
+            scan_state[f"{project}/{job.month}"] = time.time()
+    else:
+        stats, query_params, _views = await generate_stats(job.project, monthly_query, allow_stale=False)
+        await asyncio.to_thread(write_report, job.project, job.month, stats, query_params)
+        scan_state[f"{job.project}/{job.month}"] = time.time()
+    save_scan_state()
+
+
+async def scan_worker(scan_queue: asyncio.PriorityQueue):
+    """Works through the scan queue until it is empty"""
+    while True:
+        try:
+            job = scan_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        try:
+            await run_scan_job(job)
+            scan_progress["completed"] += 1
+        # One bad job should not stop the scan, whatever went wrong: ES, the stores on disk, or the data
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            scan_progress["failed"] += 1
+            projects = ", ".join(job.batch or (job.project,))
+            print(f"Download stats: Scan of {projects} ({job.month or 'daily store'}) failed: {e}")
 
 
 async def downloads_scan_loop():
     projects = []
+    admission.current_priority.set(admission.BACKGROUND)
+    load_scan_state()
     while True:
         # Update list of projects, if possible - otherwise, fall back to cache
         projects_list = DEFAULT_PROJECTS_LIST
@@ -340,10 +1063,17 @@ async def downloads_scan_loop():
             except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
                 print(f"Download stats: Could not fetch list of projects from {projects_list}: {e}")
                 print("Download stats: Using cached entry instead")
+        # Searches for projects not in the list are turned away without asking ES, see is_known_project
+        known_projects.clear()
+        known_projects.update(projects)
 
-        # For each project, run scans if needed
-        for project in projects:
-            if datadir:
+        if datadir:
+            # Queue up scans for each project, if needed. The current month goes first, then the daily store,
+            # then backfill of older months, with projects in the order they are listed. Monthly reports for
+            # the same month are searched for in batches of projects.
+            scan_queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+            jobs = []
+            for sequence, project in enumerate(projects):
                 # Ensure the project data dir exists, otherwise make it
                 project_datadir = os.path.join(datadir, project)
                 if not os.path.isdir(project_datadir):
@@ -354,49 +1084,32 @@ async def downloads_scan_loop():
                         print(f"Download stats: Could not set up {project_datadir}: {e}")
                         print(f"Download stats: No persistent download data will be saved for this project")
                         continue
+                # Pick up any reports written before the compact report format was in use
+                if report_store:
+                    await asyncio.to_thread(report_store.import_legacy, project)
+                    # Likewise, add any reports written before the ASF-wide index existed
+                    if download_index:
+                        await asyncio.to_thread(download_index.import_reports, report_store, project)
+                jobs.extend(scan_jobs(project, sequence))
+            for job in batch_scan_jobs(jobs):
+                scan_queue.put_nowait(job)
+            save_scan_state()
 
-                # Make a list of the reports to gather. We want this month, and perhaps last N months, if the
-                # reports are outdated or missing.
-                months_to_process = []
-                today = datetime.datetime.utcnow()
-                for m in range(0, PERSISTENT_REPORTS_BACKFILL_MONTHS):
-                    today = today.replace(day=1)  # Round down to first day of the month
-                    monthly_filename = os.path.join(project_datadir, f"{today.year}-{today.month:02}.json")
-                    monthly_query = f"now-{m}M/M"  # OpenSearch whole-month query
-                    monthly_deadline = (today.replace(year=today.year if today.month != 12 else today.year+1, month=today.month % 12+1)).timestamp()
-                    report_stat = os.stat(monthly_filename) if os.path.exists(monthly_filename) else None
-                    # If no report file, empty file, or it was not updated after the month was done, schedule it
-                    if not report_stat or report_stat.st_size == 0 or report_stat.st_mtime < monthly_deadline:
-                        months_to_process.append((monthly_filename, monthly_query))
-                    today = today - datetime.timedelta(days=1)  # Wind clock back one month
-
-                for entry in months_to_process:
-                    monthly_filename, monthly_query = entry
-                    if not os.path.exists(monthly_filename):
-                        try:
-                            open(monthly_filename, "w+").write("")
-                        except OSError as e:
-                            print(f"Download stats: Cannot write to data file {monthly_filename}, skipping: {e}")
-                            continue
-
-                    # only scan if we don't have a recent stored result
-                    json_stat = os.stat(monthly_filename)
-                    #Skip if file is present, >0 bytes, and was written to recently
-                    if json_stat and json_stat.st_mtime > (time.time() - 86400) and json_stat.st_size > 0:
-                        #print(f"Skipping {monthly_filename}")
-                        continue
-                    # Grab scan results, write to disk
-                    stats, query_params = await generate_stats(project, monthly_query)
-                    json_result = {
-                        "query": query_params,
-                        "files": stats,
-                    }
-                    json.dump(json_result, open(monthly_filename, "w"), indent=2)
-                    #print(f"Wrote {monthly_filename}")
+            # Work through the queue with a limited number of concurrent workers
+            scan_progress["queued"] = scan_queue.qsize()
+            scan_progress["completed"] = 0
+            scan_progress["failed"] = 0
+            scan_progress["started"] = time.time()
+            await asyncio.gather(*[scan_worker(scan_queue) for _ in range(scan_workers)])
+            scan_progress["finished"] = time.time()
+
+            # Remove daily facts that are too old to be of use
+            if daily_store:
+                daily_store.prune(int(time.time()) // 86400 * 86400 - DAILY_STORE_DAYS * 86400)
 
         # Sleep for a couple of hours (4), then check if we need to scan again
         await asyncio.sleep(4*3600)
 
 
-plugins.root.register(downloads_scan_loop, slug="downloads", title="Real-time Download Stats", icon="bi-cloud-download", private=True)
+plugins.root.register(downloads_scan_loop, downloads_cache_warm_loop, slug="downloads", title="Real-time Download Stats", icon="bi-cloud-download", private=True)
 plugins.root.register(slug="downloads_static", title="Public Download Statistics", icon="bi-cloud-download", private=False)
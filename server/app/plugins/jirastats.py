@@ -24,25 +24,87 @@ import aiohttp
 import time
 import re
 import asfpy.pubsub
-import datetime
+import math
+import typing
+import calendar
+import functools
+import gzip
+import hashlib
+import json
+import numpy
 
 DEFAULT_SCAN_INTERVAL = 900  # Always run a scan every 15 minutes
 DEFAULT_DISCOUNT_DELTA = 600  # Calculate weekend discounts in 10 min increments
+WEEK_SECONDS = 7 * 86400
+WEEK_EPOCH = 4 * 86400  # The first Monday (00:00 UTC) after the unix epoch, weeks are counted from there
+WEEKEND_START = 4 * 86400 + 21 * 3600  # Weekends start on Fridays at 21:00 UTC (after 8pm)...
+WEEKEND_LENGTH = 59 * 3600  # ...and last until Mondays at 08:00 UTC
 DEFAULT_RETENTION = 120  # Only return tickets that are still open, or were updated in the last 120 days
 DEFAULT_SCAN_DAYS = 90  # Scan last 90 days in a full scan. This should be, at max, 500, usually ~375 issues.
+DEFAULT_RECONCILE_INTERVAL = 3600  # Check for deleted or moved tickets once an hour
+DEFAULT_PAGE_SIZE = 100  # Fetch Jira search results 100 issues at a time...
+DEFAULT_SEARCH_WORKERS = 4  # ...with up to 4 pages being fetched at the same time
+DEFAULT_REFRESH_DELAY = 5  # Gather PubSub events for 5 seconds, then refresh all tickets they mention in one go...
+DEFAULT_REFRESH_BATCH = 50  # ...looking up no more than 50 keys per search
+JIRA_ISSUE_FIELDS = "key,created,summary,status,assignee,priority,comment,creator,updated,issuetype"
+JIRA_TIME_CACHE_SIZE = 65536  # Remember the epochs of up to 64k distinct Jira timestamps
+JIRA_TIMESTAMP = re.compile(  # e.g. 2024-05-01T10:00:00.000+0000
+    r"^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.\d+)?(?:Z|([+-])(\d\d):?(\d\d))?$"
+)
+SLA_PERCENTILES = (50, 75, 90, 95)  # Response and resolve time percentiles to list in the SLA aggregates
+SLA_GROUPINGS = ("priority", "issuetype", "assignee", "week")  # Ways to break down the SLA aggregates
 DEFAULT_SLA = {  # Default (fallback) SLA
     "respond": 48,  # 48h to respond
     "resolve": 120,  # 120h to resolve
 }
 
-_cache: dict = {}
 _stats: dict = {}
+_issues_snapshot: dict = {  # The encoded list of issues, as served by /api/jira?action=stats. See publish_issues
+    "version": 0,
+    "etag": "",
+    "body": b"",
+    "body_gzip": b"",
+    "tickets": 0,
+    "published": 0,
+    "sla": {},  # SLA aggregates for the same tickets, see sla_aggregates
+}
 _scan_schedule: list = []
+_refresh_keys: set = set()  # Tickets mentioned in PubSub events, waiting to be refreshed
+_refresh_pending = asyncio.Event()
 
 
 class JiraTicket:
+    """A processed Jira ticket. Only the derived fields are kept, in slots rather than a per-instance dict, and
+    the raw issue payload (changelog, comments and all) is not retained, so it can be freed once processed."""
+
+    __slots__ = (  # In the order as_dict lists them
+        "assignee",
+        "status",
+        "closed",
+        "reopened",
+        "key",
+        "project",
+        "url",
+        "summary",
+        "created_at",
+        "updated_at",
+        "priority",
+        "author",
+        "issuetype",
+        "sla",
+        "first_response",
+        "response_time",
+        "resolve_time",
+        "closed_at",
+        "sla_met_respond",
+        "sla_met_resolve",
+        "sla_time_counted",
+        "statuses",
+        "changelog",
+        "paused",
+    )
+
     def __init__(self, data):
-        self._data = data
         self.assignee = data["fields"]["assignee"]["name"] if data["fields"]["assignee"] else None
         self.status = data["fields"]["status"]["name"]
         self.closed = self.status == "Closed"
@@ -143,9 +205,13 @@ class JiraTicket:
         elif self.sla_time_counted > (self.sla["respond"] * 3600):
             self.sla_met_respond = False
 
+        # Done appending, store the histories as (smaller) tuples
+        self.statuses = tuple(self.statuses)
+        self.changelog = tuple(self.changelog)
+
     @property
     def as_dict(self):
-        return {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+        return {k: getattr(self, k) for k in self.__slots__}
 
     @staticmethod
     def calc_sla_duration(from_epoch, to_epoch):
@@ -153,18 +219,7 @@ class JiraTicket:
         should_discount = config.reporting.jira.get("sla_discount_weekend")
         seconds_spent = to_epoch - from_epoch  # Add seconds between the two transitions
         if should_discount:
-            dt_start = datetime.datetime.utcfromtimestamp(from_epoch)
-            dt_end = datetime.datetime.utcfromtimestamp(to_epoch)
-            total_discount = 0
-            dt_temp = dt_start
-            while dt_temp < dt_end and total_discount < seconds_spent:
-                dt_temp += datetime.timedelta(seconds=DEFAULT_DISCOUNT_DELTA)
-                if (
-                    dt_temp.weekday() in [5, 6]  # Sat, Sun
-                    or (dt_temp.weekday() == 4 and dt_temp.hour > 20)  # Fri after 8pm UTC
-                    or (dt_temp.weekday() == 0 and dt_temp.hour < 8)  # Mon before 8am UTC
-                ):
-                    total_discount += DEFAULT_DISCOUNT_DELTA
+            total_discount = weekend_steps(from_epoch, to_epoch) * DEFAULT_DISCOUNT_DELTA
             seconds_spent -= min(seconds_spent, total_discount)
         return seconds_spent
 
@@ -177,66 +232,379 @@ class JiraTicket:
     @staticmethod
     def get_time(string):
         """Converts a jira ISO timestamp to unix epoch"""
-        ts = time.strptime(re.sub(r"\..*", "", str(string)), "%Y-%m-%dT%H:%M:%S")
-        epoch_local = time.mktime(ts)
-        # Account for UTC offset when computer has a local TZ
-        utc_offset = (datetime.datetime.fromtimestamp(epoch_local) - datetime.datetime.utcfromtimestamp(epoch_local)).total_seconds()
-        return int(epoch_local + utc_offset)
+        return parse_jira_time(str(string))
+
+
+@functools.lru_cache(maxsize=JIRA_TIME_CACHE_SIZE)
+def parse_jira_time(string: str) -> int:
+    """Converts a Jira ISO-8601 timestamp (e.g. 2024-05-01T10:00:00.000+0000) to a unix epoch, taking its UTC
+    offset into account. Timestamps without an offset are taken to be UTC. This is plain arithmetic, without
+    any locale or time zone lookups, and the same timestamps come up in every scan, so results are memoized."""
+    match = JIRA_TIMESTAMP.match(string)
+    if not match:
+        raise ValueError(f"Not a Jira timestamp: {string}")
+    year, month, day, hour, minute, second, sign, offset_hours, offset_minutes = match.groups()
+    epoch = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+    if sign:
+        offset = int(offset_hours) * 3600 + int(offset_minutes) * 60
+        epoch -= offset if sign == "+" else -offset
+    return epoch
+
+
+def weekend_steps(from_epoch, to_epoch, step=DEFAULT_DISCOUNT_DELTA):
+    """Counts the weekend discount steps between two epochs: Stepping from from_epoch in [step] second
+    increments until reaching to_epoch, this is the number of steps that land in a weekend. Rather than
+    stepping through the span, each whole week is known to hold WEEKEND_LENGTH/step weekend steps, and the
+    steps in the remaining partial week are counted per weekend it overlaps."""
+    if to_epoch <= from_epoch:
+        return 0
+    steps = math.ceil((to_epoch - from_epoch) / step)  # Steps land on from_epoch + step*n, for n = 1..steps
+    # Week and weekend lengths are whole numbers of steps, so every week of steps looks the same
+    whole_weeks, remaining_steps = divmod(steps, WEEK_SECONDS // step)
+    count = whole_weeks * (WEEKEND_LENGTH // step)
+    week_offset = (from_epoch - WEEK_EPOCH) % WEEK_SECONDS  # Position of from_epoch within its week
+
+    def steps_before(position):
+        """Returns the number of remaining steps that land before a position, relative to from_epoch's week"""
+        return min(remaining_steps, max(0, math.ceil((position - week_offset) / step) - 1))
+
+    # The remaining steps span less than a week from week_offset, so they can only overlap the weekends
+    # ending this week, starting this week, or starting next week.
+    for weekend_start in (WEEKEND_START - WEEK_SECONDS, WEEKEND_START, WEEKEND_START + WEEK_SECONDS):
+        count += steps_before(weekend_start + WEEKEND_LENGTH) - steps_before(weekend_start)
+    return count
 
 
 def process_cache(issues):
-    if issues:
-        _stats.clear()  # Clear stats cache if we have data, so as to remove deleted tickets
+    """Merges scanned issues into the working set, by key. Tickets are only rebuilt if they were updated since
+    they were last processed, or if they are still open, as the SLA clock keeps running for those. Scans and
+    refreshes fetch pages concurrently, so a page may arrive after a newer one with the same ticket: Issues older
+    than the ticket we have are skipped. Tickets not in this scan are kept, see reconcile_keys for removing deleted
+    ones. Returns the number of tickets rebuilt."""
+    rebuilt = 0
     for issue in issues:
         key = issue["key"]
-        _cache[key] = issue
-        ticket = JiraTicket(issue)
-        _stats[key] = ticket
-    return len(issues)
+        ticket = _stats.get(key)
+        if ticket:
+            updated_at = JiraTicket.get_time(issue["fields"]["updated"])
+            if updated_at < ticket.updated_at or (ticket.closed and updated_at == ticket.updated_at):
+                continue
+        _stats[key] = JiraTicket(issue)
+        rebuilt += 1
+    return rebuilt
 
 
-def get_issues():
+def reconcile_keys(keys):
+    """Removes tickets that are no longer in the set of keys of the full scan window (deleted or moved tickets,
+    or closed tickets that have not been updated in a while). Returns the number of tickets removed."""
+    removed = [key for key in _stats if key not in keys]
+    for key in removed:
+        _stats.pop(key, None)
+    return len(removed)
+
+
+def get_tickets():
+    """Returns the tickets that are still open, or were updated in the past DEFAULT_RETENTION days"""
     deadline = time.time() - (DEFAULT_RETENTION * 86400)
-    return [x.as_dict for x in _stats.values() if x.closed is False or x.updated_at >= deadline]
+    return [x for x in _stats.values() if x.closed is False or x.updated_at >= deadline]
 
 
-async def jira_scan_full(days=DEFAULT_SCAN_DAYS):
-    """Performs a full scan of Jira activity in the past [days] days"""
+def get_issues():
+    return [x.as_dict for x in get_tickets()]
+
+
+def group_percentiles(codes, values, groups):
+    """Returns the SLA_PERCENTILES of the values in each of [groups] groups, as a groups x percentiles array,
+    interpolated the same way as numpy.percentile does. Groups without values get NaN. All groups are done
+    in one go: values are sorted by group and value, so each percentile is a lookup into the group's slice."""
+    order = numpy.lexsort((values, codes))
+    values = values[order].astype(numpy.float64)
+    counts = numpy.bincount(codes, minlength=groups)
+    starts = numpy.cumsum(counts) - counts
+    positions = starts[:, None] + numpy.array(SLA_PERCENTILES)[None, :] / 100 * numpy.maximum(counts - 1, 0)[:, None]
+    if not len(values):
+        return numpy.full(positions.shape, numpy.nan)
+    lower = numpy.minimum(numpy.floor(positions).astype(numpy.int64), len(values) - 1)
+    upper = numpy.minimum(numpy.ceil(positions).astype(numpy.int64), len(values) - 1)
+    result = values[lower] + (values[upper] - values[lower]) * (positions - lower)
+    result[counts == 0] = numpy.nan
+    return result
+
+
+def sla_aggregates(tickets):
+    """Works out SLA compliance for a set of tickets, overall and broken down by each of SLA_GROUPINGS (week
+    is the Monday of the week the ticket was created in). For each group, this lists the number of tickets,
+    open tickets, response and resolve SLAs met and missed (not counting issue types without SLAs), and
+    the response and resolve time percentiles in seconds (of tickets that were responded to and resolved).
+    The tickets are turned into arrays once, so every group of every breakdown is computed at the same time."""
+    no_slas = config.reporting.jira.get("no_slas", [])
+    columns = list(
+        zip(
+            *(
+                (
+                    x.priority,
+                    x.issuetype,
+                    x.assignee or "(unassigned)",
+                    x.created_at,
+                    x.closed,
+                    x.issuetype not in no_slas,
+                    -1 if x.sla_met_respond is None else x.sla_met_respond,
+                    -1 if x.sla_met_resolve is None else x.sla_met_resolve,
+                    x.response_time if x.first_response else -1,
+                    x.resolve_time if x.closed and x.resolve_time else -1,
+                )
+                for x in tickets
+            )
+        )
+    ) or [()] * 10
+    dtypes = (str, str, str, numpy.int64, bool, bool, numpy.int8, numpy.int8, numpy.int64, numpy.int64)
+    priority, issuetype, assignee, created_at, closed, has_sla, met_respond, met_resolve, respond, resolve = (
+        numpy.array(column, dtype=dtype) for column, dtype in zip(columns, dtypes)
+    )
+    week = created_at - (created_at - WEEK_EPOCH) % WEEK_SECONDS
+    measures = {
+        "tickets": numpy.ones(len(created_at), dtype=bool),
+        "open": ~closed,
+        "respond_met": has_sla & (met_respond == 1),
+        "respond_missed": has_sla & (met_respond == 0),
+        "resolve_met": has_sla & (met_resolve == 1),
+        "resolve_missed": has_sla & (met_resolve == 0),
+    }
+    responded = respond >= 0
+    resolved = resolve >= 0
+
+    def breakdown(labels, codes):
+        groups = len(labels)
+        counts = {name: numpy.bincount(codes[mask], minlength=groups) for name, mask in measures.items()}
+        respond_times = group_percentiles(codes[responded], respond[responded], groups)
+        resolve_times = group_percentiles(codes[resolved], resolve[resolved], groups)
+        return {
+            str(label): {
+                "tickets": int(counts["tickets"][i]),
+                "open": int(counts["open"][i]),
+                "respond": {"met": int(counts["respond_met"][i]), "missed": int(counts["respond_missed"][i])},
+                "resolve": {"met": int(counts["resolve_met"][i]), "missed": int(counts["resolve_missed"][i])},
+                "response_time": None if numpy.isnan(respond_times[i][0]) else [round(x) for x in respond_times[i]],
+                "resolve_time": None if numpy.isnan(resolve_times[i][0]) else [round(x) for x in resolve_times[i]],
+            }
+            for i, label in enumerate(labels)
+        }
+
+    aggregates = {
+        "percentiles": SLA_PERCENTILES,
+        "overall": breakdown(["all"], numpy.zeros(len(created_at), dtype=numpy.int64))["all"],
+    }
+    for grouping, values in zip(SLA_GROUPINGS, (priority, issuetype, assignee, week)):
+        labels, codes = numpy.unique(values, return_inverse=True)
+        if grouping == "week":
+            labels = [time.strftime("%Y-%m-%d", time.gmtime(x)) for x in labels.tolist()]
+        aggregates[grouping] = breakdown(labels, codes)
+    return aggregates
+
+
+def publish_issues():
+    """Encodes (and compresses) the list of issues once, to be served as-is until the next scan is done,
+    and works out the SLA aggregates for it. The version is only bumped, and a new ETag handed out, if the
+    list has actually changed."""
+    tickets = get_tickets()
+    issues = [x.as_dict for x in tickets]
+    body = json.dumps(issues, separators=(",", ":")).encode("utf-8")
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    if etag != _issues_snapshot["etag"]:
+        _issues_snapshot.update(
+            version=_issues_snapshot["version"] + 1,
+            etag=etag,
+            body=body,
+            body_gzip=gzip.compress(body, mtime=0),
+            tickets=len(issues),
+            sla=sla_aggregates(tickets),
+        )
+    _issues_snapshot["published"] = int(time.time())
+
+
+def get_issues_snapshot():
+    """Returns the encoded list of issues, as of the last scan. Encodes it first if nothing was published yet."""
+    if not _issues_snapshot["version"]:
+        publish_issues()
+    return _issues_snapshot
+
+
+async def fetch_search_page(hc: aiohttp.ClientSession, params: dict, start_at: int):
+    """Fetches a single page of Jira search results, starting at result number [start_at].
+    Returns None if the page could not be fetched."""
     jira_scan_url = config.reporting.jira["api_url"] + "search"
-    jira_project = config.reporting.jira["project"]
+    try:
+        async with hc.get(jira_scan_url, params={**params, "startAt": str(start_at)}) as req:
+            if req.status == 200:
+                return await req.json()
+            print(f"Jira search for results {start_at} and on failed with status {req.status}")
+            return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Jira search for results {start_at} and on failed: {e!r}")
+        return None
+
+
+async def jira_search(params: dict, on_page: typing.Callable[[list], typing.Any]):
+    """Runs a Jira search, fetching all pages of results. The first page tells us the total number of results,
+    and how many the server actually returns per page, then the remaining pages are fetched concurrently, with
+    no more than DEFAULT_SEARCH_WORKERS at a time. Each page of issues is handed to on_page as soon as it has
+    arrived, in whichever order the pages arrive. Returns the number of issues fetched, or None if any page
+    could not be fetched."""
     jira_token = config.reporting.jira["token"]
+    # Order by key, so results don't shift between pages as tickets are updated while we page through them
+    params = {**params, "maxResults": str(DEFAULT_PAGE_SIZE), "jql": params["jql"] + " order by key"}
+
+    async with aiohttp.ClientSession(headers={"Authorization": f"Bearer: {jira_token}"}) as hc:
+        first_page = await fetch_search_page(hc, params, 0)
+        if first_page is None:
+            return None
+        issues = first_page.get("issues", [])
+        on_page(issues)
+        fetched = len(issues)
+        total = first_page.get("total", fetched)
+        page_size = first_page.get("maxResults") or fetched  # The server may cap the page size
+        if not page_size:
+            return fetched
+
+        page_limiter = asyncio.Semaphore(DEFAULT_SEARCH_WORKERS)
+
+        async def fetch_limited(start_at):
+            async with page_limiter:
+                return await fetch_search_page(hc, params, start_at)
+
+        complete = True
+        for next_page in asyncio.as_completed([fetch_limited(start_at) for start_at in range(page_size, total, page_size)]):
+            page = await next_page
+            if page is None:
+                complete = False
+                continue
+            issues = page.get("issues", [])
+            on_page(issues)
+            fetched += len(issues)
+        return fetched if complete else None
+
+
+async def jira_scan_full(days=DEFAULT_SCAN_DAYS):
+    """Performs a full scan of Jira activity in the past [days] days. Returns the number of tickets rebuilt."""
+    jira_project = config.reporting.jira["project"]
 
     params = {
-        "fields": "key,created,summary,status,assignee,priority,comment,creator,updated,issuetype",
+        "fields": JIRA_ISSUE_FIELDS,
         "expand": "changelog",
-        "maxResults": "1000",
         "jql": f"""project={jira_project} and (updated>=-{days}d or status!=closed)""",
     }
 
-    async with aiohttp.ClientSession(headers={"Authorization": f"Bearer: {jira_token}"}) as hc:
-        async with hc.get(jira_scan_url, params=params) as req:
-            if req.status == 200:
-                jira_json = await req.json()
-                processed = process_cache(jira_json.get("issues", []))
-                return processed
+    processed = 0
+
+    def process_page(issues):
+        nonlocal processed
+        processed += process_cache(issues)
+
+    await jira_search(params, process_page)
+    return processed
+
+
+async def jira_refresh(keys):
+    """Fetches and rebuilds only the tickets with the given keys, DEFAULT_REFRESH_BATCH keys per search.
+    Returns the number of tickets rebuilt, or None if any of the searches could not be completed."""
+    jira_project = config.reporting.jira["project"]
+    keys = sorted(keys)
+    processed = 0
+    complete = True
+
+    def process_page(issues):
+        nonlocal processed
+        processed += process_cache(issues)
+
+    for i in range(0, len(keys), DEFAULT_REFRESH_BATCH):
+        params = {
+            "fields": JIRA_ISSUE_FIELDS,
+            "expand": "changelog",
+            "jql": f"""project={jira_project} and key in ({",".join(keys[i:i + DEFAULT_REFRESH_BATCH])})""",
+            "validateQuery": "false",  # Don't fail the whole batch if one of the tickets was deleted or moved
+        }
+        if await jira_search(params, process_page) is None:
+            complete = False
+    return processed if complete else None
+
+
+def find_issue_keys(payload):
+    """Returns the keys of the tickets in our Jira project that a PubSub payload mentions, if any"""
+    issue_key = re.compile(rf"""\b{re.escape(config.reporting.jira["project"])}-\d+\b""")
+    return set(issue_key.findall(json.dumps(payload)))
+
+
+async def jira_reconcile(days=DEFAULT_SCAN_DAYS):
+    """Fetches only the keys of the tickets in the full scan window, and removes any other tickets from the
+    working set. Returns the number of tickets removed, or None if the keys could not be fetched in full."""
+    jira_project = config.reporting.jira["project"]
+
+    params = {
+        "fields": "key",
+        "jql": f"""project={jira_project} and (updated>=-{days}d or status!=closed)""",
+    }
+
+    keys = set()
+    fetched = await jira_search(params, lambda issues: keys.update(issue["key"] for issue in issues))
+    if fetched is None:  # Not the full list, don't remove anything
+        return None
+    return reconcile_keys(keys)
 
 
 async def scan_loop():
     await jira_scan_full()  # On startup, do a full 90 day scan
+    publish_issues()
+    last_reconciled = last_scanned = time.time()
     while True:
-        if _scan_schedule:  # Things are scheduled for a scan
-            now = time.time()
+        # Things are scheduled for a scan, or it's time for the regular scan, in case we missed any PubSub events
+        if _scan_schedule or time.time() - last_scanned >= DEFAULT_SCAN_INTERVAL:
+            now = last_scanned = time.time()
             print("Starting Jira scan")
             processed = await jira_scan_full(days=1)  # Only search past 24 hours on a regular scan
             print(f"Processed {processed} tickets in {int(time.time()-now)} seconds")
-            _scan_schedule.pop()  # pop an item, freeing up space to allocate a new scan
+            publish_issues()
+            if _scan_schedule:
+                _scan_schedule.pop()  # pop an item, freeing up space to allocate a new scan
+        if time.time() - last_reconciled >= DEFAULT_RECONCILE_INTERVAL:
+            removed = await jira_reconcile()
+            if removed is not None:
+                print(f"Removed {removed} deleted or expired tickets")
+            if removed:
+                publish_issues()
+            last_reconciled = time.time()
         await asyncio.sleep(60)  # Always wait 60 secs between scan checks
 
 
+async def refresh_loop():
+    """Refreshes the tickets that PubSub events were seen for. Events are gathered for DEFAULT_REFRESH_DELAY
+    seconds after the first one, so a burst of events (e.g. a comment and a status change) costs one search."""
+    while True:
+        await _refresh_pending.wait()
+        await asyncio.sleep(DEFAULT_REFRESH_DELAY)
+        keys = set(_refresh_keys)
+        _refresh_keys.clear()
+        _refresh_pending.clear()
+        now = time.time()
+        try:
+            processed = await jira_refresh(keys)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Could not refresh {len(keys)} tickets: {e}")
+            processed = None
+        if processed is None:  # Some tickets may not have been refreshed, have a scan pick them up
+            print(f"Could not refresh all of {len(keys)} tickets, scheduling a scan instead")
+            if len(_scan_schedule) < 2:
+                _scan_schedule.append(time.time())
+        else:
+            print(f"Refreshed {processed} of {len(keys)} tickets in {int(time.time()-now)} seconds")
+        publish_issues()  # Publish whatever was refreshed, a failed search may still have fetched some pages
+
+
 async def poll_loop():
-    """Schedules a scan every DEFAULT_SCAN_INTERVAL seconds, plus when a pubsub event happens.
-    No more than two events can be scheduled at any given time (iow if a scan is running, and
-    we get a pubsub event, we can add one more scan to be done in the future."""
+    """Schedules a scan on startup and whenever the pubsub connection is (re-)established, or every
+    DEFAULT_SCAN_INTERVAL seconds without pubsub. Pubsub events mentioning tickets have only those tickets
+    refreshed (see refresh_loop), other events schedule a scan. No more than two scans can be scheduled
+    at any given time (iow if a scan is running, and we get a pubsub event, we can add one more scan
+    to be done in the future."""
     loop = asyncio.get_running_loop()
 
     def maybe_timeout(duration):
@@ -261,7 +629,11 @@ async def poll_loop():
                     async for payload in asfpy.pubsub.listen(pubsub_url):
                         to.reschedule(loop.time() + 60)  # Got a response, pubsub works, reschedule timeout
                         if "stillalive" not in payload:  # Not a ping
-                            if len(_scan_schedule) < 2:
+                            keys = find_issue_keys(payload)
+                            if keys:  # Refresh just the tickets this event is about
+                                _refresh_keys.update(keys)
+                                _refresh_pending.set()
+                            elif len(_scan_schedule) < 2:
                                 _scan_schedule.append(time.time())  # add scan to schedule
             except TimeoutError:
                 print("PubSub connection timed out, re-establishing")
@@ -270,4 +642,4 @@ async def poll_loop():
             await asyncio.sleep(DEFAULT_SCAN_INTERVAL)
 
 
-plugins.root.register(poll_loop, scan_loop, slug="jira", title="Jira Tickets (INFRA)", icon="bi-bug-fill", private=True)
+plugins.root.register(poll_loop, scan_loop, refresh_loop, slug="jira", title="Jira Tickets (INFRA)", icon="bi-bug-fill", private=True)
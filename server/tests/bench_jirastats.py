@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Benchmarks the Jira statistics over a synthetic, seeded corpus of 1000 tickets:
+    python tests/bench_jirastats.py
+"""
+import os
+import random
+import sys
+import time
+import timeit
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TICKETS = 1000
+NOW = 1717243200  # 2024-06-01 12:00 UTC
+
+
+def jira_time(epoch: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000+0000", time.gmtime(epoch))
+
+
+def make_issues() -> list:
+    """Tickets as the Jira search API returns them, open for anything from minutes to months"""
+    rng = random.Random(18)
+    issues = []
+    for n in range(TICKETS):
+        created = NOW - rng.randint(3600, 365 * 86400)
+        histories = []
+        comments = []
+        closed = rng.random() < 0.8
+        epoch = created
+        status = "Waiting for Infra"
+        for _ in range(rng.randint(0, 4)):  # Back and forth between the reporter and infra
+            epoch = min(NOW, epoch + rng.randint(600, 10 * 86400))
+            comments.append({"author": {"name": "infra"}, "created": jira_time(epoch)})
+            new_status = "Waiting for user" if status == "Waiting for Infra" else "Waiting for Infra"
+            histories.append(
+                {
+                    "author": {"name": "infra"},
+                    "created": jira_time(epoch),
+                    "items": [{"field": "status", "fromString": status, "toString": new_status}],
+                }
+            )
+            status = new_status
+        if closed:
+            epoch = min(NOW, epoch + rng.randint(600, 30 * 86400))
+            histories.append(
+                {
+                    "author": {"name": "infra"},
+                    "created": jira_time(epoch),
+                    "items": [
+                        {"field": "resolution", "fromString": None, "toString": "Fixed"},
+                        {"field": "status", "fromString": status, "toString": "Closed"},
+                    ],
+                }
+            )
+            status = "Closed"
+        issues.append(
+            {
+                "key": f"INFRA-{n}",
+                "fields": {
+                    "assignee": {"name": "infra"},
+                    "status": {"name": status},
+                    "summary": f"Ticket {n}",
+                    "created": jira_time(created),
+                    "updated": jira_time(epoch),
+                    "priority": {"name": rng.choice(("Minor", "Major", "Critical"))},
+                    "creator": {"name": "reporter"},
+                    "issuetype": {"name": "Task"},
+                    "comment": {"comments": comments},
+                },
+                "changelog": {"histories": histories},
+            }
+        )
+    return issues
+
+
+def bench(name: str, func, repeat: int = 3):
+    """Prints and returns the best time of a few runs of func"""
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    print(f"{name:<50} {seconds * 1000:10.1f} ms")
+    return seconds
+
+
+def main():
+    sys.path.insert(0, TESTS_DIR)
+    import conftest  # pylint: disable=unused-import,import-outside-toplevel
+    from app.plugins import jirastats  # pylint: disable=import-outside-toplevel
+    import test_jirastats  # pylint: disable=import-outside-toplevel
+
+    issues = make_issues()
+    spans = []
+    original_calc = jirastats.JiraTicket.calc_sla_duration
+
+    def recording_calc(from_epoch, to_epoch):
+        spans.append((from_epoch, to_epoch))
+        return original_calc(from_epoch, to_epoch)
+
+    jirastats.JiraTicket.calc_sla_duration = staticmethod(recording_calc)
+    tickets = [jirastats.JiraTicket(issue) for issue in issues]
+    jirastats.JiraTicket.calc_sla_duration = staticmethod(original_calc)
+    print(f"{len(tickets)} tickets, {len(spans)} SLA spans, {sum(b - a for a, b in spans) / 86400:.0f} days in total")
+
+    assert [original_calc(*x) for x in spans] == [test_jirastats.stepping_sla_duration(*x) for x in spans]
+    stepping = bench(
+        "SLA durations, stepping every 10 minutes", lambda: [test_jirastats.stepping_sla_duration(*x) for x in spans], 1
+    )
+    arithmetic = bench("SLA durations, counting weekends", lambda: [original_calc(*x) for x in spans])
+    print(f"{'':<50} {stepping / arithmetic:10.0f}x faster")
+    bench("Building all tickets", lambda: [jirastats.JiraTicket(issue) for issue in issues])
+
+    timestamps = [jira_time(NOW - n * 977) for n in range(20000)]
+    per_timestamp = 1_000_000 / len(timestamps)
+    strptime = bench("20000 timestamps, time.strptime", lambda: [test_jirastats.strptime_jira_time(x) for x in timestamps])
+
+    def parse_cold():
+        jirastats.parse_jira_time.cache_clear()
+        return [jirastats.parse_jira_time(x) for x in timestamps]
+
+    cold = bench("20000 timestamps, parse_jira_time", parse_cold)
+    warm = bench("20000 timestamps, parse_jira_time, all cached", lambda: [jirastats.parse_jira_time(x) for x in timestamps])
+    print(
+        f"{'':<50} {strptime * per_timestamp:.2f} vs {cold * per_timestamp:.2f} vs {warm * per_timestamp:.2f} µs per timestamp"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Benchmarks the user agent post-processing of download stats searches, over a synthetic, seeded corpus of
+14,400 agent buckets (about one search of 60 artifacts x 60 agents, across both aggs and providers):
+    python tests/bench_useragents.py
+"""
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+import ua_parser.user_agent_parser
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BUCKETS = 14400
+DISTINCT_AGENTS = 7000
+
+
+def make_agents() -> list:
+    """Agent strings as they show up in download searches: browsers, download tools, package managers and junk,
+    with many versions of each, and the popular ones repeated"""
+    rng = random.Random(4)
+    templates = (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{a}.0.{b}.{c} Safari/537.36",
+        "Mozilla/5.0 (X11; Linux x86_64; rv:{a}.0) Gecko/20100101 Firefox/{a}.{b}",
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_{b}) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{a}.{b} Safari/605.1.15",
+        "Wget/1.{a}.{b} (linux-gnu)",
+        "curl/{a}.{b}.{c}",
+        "Apache-Maven/3.{a}.{b} (Java 17.0.{c}; Linux 5.15.0-{c}-generic)",
+        "Microsoft-Delivery-Optimization/10.{a}",
+        "winget-cli WindowsPackageManager/1.{a}.{b} DesktopAppInstaller/Microsoft.DesktopAppInstaller v1.{c}",
+        "NSIS_Inetc (Mozilla)/{a}.{b}",
+        "Artifactory/7.{a}.{b} {c}",
+        "Transmission/{a}.{b}{c}",
+        "Scoop/1.{a} (+http://scoop.sh/) PowerShell/7.{b} (Windows NT 10.0; Win64; x64; Core)",
+        "python-requests/2.{a}.{b}",
+        "Go-http-client/1.{a}",
+        "custom-mirror-sync/{a}.{b}.{c} (build {c})",
+    )
+    distinct = [
+        rng.choice(templates).format(a=rng.randint(1, 130), b=rng.randint(0, 99), c=rng.randint(0, 9999))
+        for _ in range(DISTINCT_AGENTS)
+    ]
+    popular = distinct[:200]
+    return [rng.choice(popular) if rng.random() < 0.5 else rng.choice(distinct) for _ in range(BUCKETS)]
+
+
+def classify_with_parse(internal_agents: dict, ua_agent: str) -> str:
+    """The original classification, parsing every agent string of every search, kept for comparison"""
+    # NOTE: ua_parser will set OS and UA Family to "Other" when it doesn't recognize the UA string.
+    ua = ua_parser.user_agent_parser.Parse(ua_agent)
+    ua_os_family = ua.get("os", {}).get("family", "Unknown")
+    # If OS is "Other", we'll adjust it to "Unknown" ourselves.
+    if ua_os_family == "Other":
+        ua_os_family = "Unknown"
+    # UA family will typically be "Other" when unknown to the parser, we'll address this below.
+    # If the family is empty, we'll also set to Other and adjust later on.
+    ua_agent_family = ua.get("user_agent", {}).get("family", "Other")
+    # Adjust for various package managers we know of
+    if ua_agent_family == "Other":
+        for ia_key, ia_names in internal_agents.items():
+            if any(x in ua_agent for x in ia_names):
+                ua_agent_family = ia_key
+                break
+    # If we still don't know what this is, mark as "Unknown", to distinguish from the combined "Other" chart group.
+    if ua_agent_family == "Other":
+        ua_agent_family = "Unknown"
+    return ua_os_family + " / " + ua_agent_family
+
+
+def bench(name: str, func, repeat: int = 1):
+    """Prints and returns the best time of a few runs of func"""
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    print(f"{name:<50} {seconds * 1000:10.1f} ms")
+    return seconds
+
+
+def main():
+    sys.path.insert(0, TESTS_DIR)
+    import conftest  # pylint: disable=unused-import,import-outside-toplevel
+    from app.lib import useragents  # pylint: disable=import-outside-toplevel
+    from app.plugins import downloads  # pylint: disable=import-outside-toplevel
+
+    agents = make_agents()
+    print(f"{len(agents)} agent buckets, {len(set(agents))} distinct agent strings")
+    expected: list = []
+    bench(
+        "Before: Parse + INTERNAL_AGENTS for every bucket",
+        lambda: expected.extend(classify_with_parse(downloads.INTERNAL_AGENTS, x) for x in agents),
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_filepath = os.path.join(tmpdir, "useragents.db")
+        classifier = useragents.UserAgentClassifier(downloads.INTERNAL_AGENTS, db_filepath=db_filepath)
+
+        def classify_and_flush():
+            assert [classifier.classify(x) for x in agents] == expected
+            classifier.flush()
+
+        bench("UserAgentClassifier, cold", classify_and_flush)
+        bench("UserAgentClassifier, memo warm", lambda: [classifier.classify(x) for x in agents], 3)
+        restarted = useragents.UserAgentClassifier(downloads.INTERNAL_AGENTS, db_filepath=db_filepath)
+        bench("UserAgentClassifier, after a restart (disk warm)", lambda: [restarted.classify(x) for x in agents])
+        print(f"{'':<50} {restarted.stats}")
+
+
+if __name__ == "__main__":
+    main()
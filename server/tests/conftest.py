@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""ASF Infrastructure Reporting Dashboard - Test setup
+The app reads its configuration from ../reporting-dashboard.yaml when it is imported, and the plugins register
+their endpoints and background loops on asfquart.APP, so both are set up here before any test imports the app.
+Run from the server directory with: python -m pytest tests"""
+import os
+import sys
+import tempfile
+import types
+
+import asfquart
+import quart
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_CONFIG = """
+server: {bind: 127.0.0.1, port: 8080}
+reporting:
+  jira:
+    ticket_url: "https://issues.apache.org/jira/browse/{key}"
+    slas: {}
+    sla_discount_weekend: true
+    sla_apply_statuses: ["Waiting for Infra"]
+    no_slas: ["Planned Work"]
+    project: INFRA
+    api_url: "http://localhost/jira/rest/api/2/"
+    token: test
+  userid:
+    valid_userid_syntax: "^[a-z][a-z0-9]+$"
+  downloads:
+    dataurl: "http://localhost:9200"
+    datadir: %(datadir)s/downloads
+github: {read_token: test, datadir: %(datadir)s/github}
+"""
+
+
+class TestApp(quart.Quart):
+    """Collects the routes, but does not start the background loops the plugins register"""
+
+    def add_background_task(self, func, *args, **kwargs):
+        pass
+
+
+workdir = tempfile.mkdtemp(prefix="reporting-dashboard-tests-")
+for subdir in ("run", "downloads", "github"):
+    os.makedirs(os.path.join(workdir, subdir))
+with open(os.path.join(workdir, "reporting-dashboard.yaml"), "w") as f:
+    f.write(TEST_CONFIG % {"datadir": workdir})
+os.chdir(os.path.join(workdir, "run"))
+sys.path.insert(0, SERVER_DIR)
+asfquart.APP = TestApp(__name__)
+# The machines plugin fetches its host list from svn.apache.org as it is imported
+sys.modules["app.plugins.machines"] = types.ModuleType("app.plugins.machines")
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Records the ES responses used by test_downloads_query.py, from a small, seeded set of synthetic downloads.
+The search engine here implements just the aggregations the download stats searches use.
+
+Record every search the current make_query makes for the test cases, with its response (or error):
+    python tests/fixtures/record_downloads.py searches
+Record the single-search responses of the code before details were searched per artifact (user-012), by pointing
+at a checkout of that code, e.g. git worktree add /tmp/before-user-012 <commit before user-012>:
+    python tests/fixtures/record_downloads.py legacy /tmp/before-user-012/server
+"""
+import asyncio
+import collections
+import gzip
+import json
+import os
+import random
+import sys
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+SEARCHES_FILE = os.path.join(FIXTURES_DIR, "downloads_searches.json.gz")
+LEGACY_FILE = os.path.join(FIXTURES_DIR, "downloads_legacy.json.gz")
+NOW = 1717243200  # 2024-06-01 12:00 UTC, all downloads are in the 8 days before
+CASES = (  # project, duration, max_hits, max_buckets (None = no limit)
+    ("httpd", 7, 6, None),
+    ("httpd", 3, 60, None),
+    ("ponymail", 7, 5, None),
+    ("httpd", 7, 8, 150),  # Forces the artifact details to be searched in smaller pages
+)
+
+
+def make_downloads() -> list:
+    rng = random.Random(12)
+    downloads = []
+    for project, prefix in (("httpd", "/httpd/"), ("ponymail", "/incubator/ponymail/")):
+        for i in range(14):
+            path = f"{prefix}{project}-1.{i}.tar.gz" if i % 5 else f"{prefix}{project}-1.{i}.zip?mirror=x"
+            weight = rng.choice((1, 3, 8))
+            size = rng.choice((10_000, 2_000_000, 90_000_000))
+            for _ in range(rng.randint(2, 12) * weight):
+                downloads.append(
+                    {
+                        "uri": path,
+                        "ts": NOW - rng.uniform(0, 8 * 86400),
+                        "bytes": size + rng.randint(0, 999),
+                        "ip": f"10.0.0.{rng.randint(0, 30)}",
+                        "ua": rng.choice(
+                            ["Wget/1.21", "curl/8.4.0", "Mozilla/5.0 (X11; Linux) Firefox/126.0", "winget-cli"]
+                        ),
+                        "cc": rng.choice(["US", "DE", "IN", "-"]),
+                    }
+                )
+    return downloads
+
+
+def find_prefixes(node, prefixes: list) -> list:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "prefix":
+                prefixes.extend(value.values())
+            else:
+                find_prefixes(value, prefixes)
+    elif isinstance(node, list):
+        for value in node:
+            find_prefixes(value, prefixes)
+    return prefixes
+
+
+def terms_agg(docs: list, spec: dict, sub_aggs: dict) -> dict:
+    if "include" in spec:
+        docs = [doc for doc in docs if doc["uri"] in set(spec["include"])]
+    field = "ua" if "agent" in spec["field"] else ("cc" if "geo" in spec["field"] else "uri")
+    groups = collections.defaultdict(list)
+    for doc in docs:
+        groups[doc[field]].append(doc)
+    if spec.get("order") == {"bytes_sum": "desc"}:
+        keys = sorted(groups, key=lambda k: (-sum(doc["bytes"] for doc in groups[k]), k))
+    else:
+        keys = sorted(groups, key=lambda k: (-len(groups[k]), k))
+    keys = keys[: spec.get("size", 10)]
+    return {
+        "doc_count_error_upper_bound": 0,
+        "sum_other_doc_count": sum(len(groups[k]) for k in groups if k not in keys),
+        "buckets": [{"key": k, "doc_count": len(groups[k]), **run_aggs(groups[k], sub_aggs)} for k in keys],
+    }
+
+
+def run_aggs(docs: list, aggs: dict) -> dict:
+    results = {}
+    for name, agg in (aggs or {}).items():
+        if "terms" in agg:
+            results[name] = terms_agg(docs, agg["terms"], agg.get("aggs"))
+        elif "sum" in agg:
+            results[name] = {"value": float(sum(doc["bytes"] for doc in docs))}
+        elif "cardinality" in agg:
+            results[name] = {"value": len(set(doc["ip"] for doc in docs))}
+        elif "filters" in agg:  # Keyed buckets, each matching the prefixes in its query
+            results[name] = {
+                "buckets": {key: filter_bucket(docs, query, agg.get("aggs")) for key, query in agg["filters"]["filters"].items()}
+            }
+        elif "date_histogram" in agg:
+            days = collections.defaultdict(list)
+            for doc in docs:
+                days[int(doc["ts"] // 86400 * 86400)].append(doc)
+            results[name] = {
+                "buckets": [
+                    {"key_as_string": str(day), "key": day * 1000, "doc_count": len(days[day]), **run_aggs(days[day], agg.get("aggs"))}
+                    for day in sorted(days)
+                ]
+            }
+        else:
+            raise ValueError(f"Unsupported aggregation: {agg}")
+    return results
+
+
+def filter_bucket(docs: list, query: dict, sub_aggs: dict) -> dict:
+    matches = [doc for doc in docs if doc["uri"].startswith(tuple(find_prefixes(query, [])))]
+    return {"doc_count": len(matches), **run_aggs(matches, sub_aggs)}
+
+
+def count_buckets(node) -> int:
+    count = 0
+    if isinstance(node, dict):
+        count += len(node.get("buckets", ()))
+        count += sum(count_buckets(value) for value in node.values())
+    elif isinstance(node, list):
+        count += sum(count_buckets(value) for value in node)
+    return count
+
+
+class SyntheticES:
+    """Answers download stats searches from the synthetic downloads, and records them"""
+
+    def __init__(self, downloads: list, max_buckets=None):
+        self.downloads = downloads
+        self.max_buckets = max_buckets
+        self.searches: list = []
+
+    async def search(self, index, body, **_kwargs):
+        import elasticsearch
+
+        body = json.loads(json.dumps(body))
+        timespan = [f["range"] for f in body["query"]["bool"]["filter"] if "range" in f and "bytes" not in f["range"]]
+        days = int(list(timespan[0].values())[0]["gte"][len("now-") : -len("d")])
+        prefixes = find_prefixes(body["query"]["bool"]["should"], [])
+        docs = [
+            doc
+            for doc in self.downloads
+            if doc["ts"] >= NOW - days * 86400 and any(doc["uri"].startswith(prefix) for prefix in prefixes)
+        ]
+        if not index.startswith("fastly"):  # The other provider sees different downloads
+            docs = docs[::2]
+        response = {
+            "took": 3,
+            "timed_out": False,
+            "hits": {"total": {"value": len(docs), "relation": "eq"}, "hits": []},
+            "aggregations": run_aggs(docs, body["aggs"]),
+        }
+        search = {"index": index, "body": body}
+        self.searches.append(search)
+        if self.max_buckets and count_buckets(response) > self.max_buckets:
+            search["error"] = {
+                "status": 400,
+                "error": {
+                    "type": "search_phase_execution_exception",
+                    "caused_by": {
+                        "type": "too_many_buckets_exception",
+                        "reason": f"Trying to create too many buckets. Must be less than or equal to: [{self.max_buckets}]",
+                    },
+                },
+            }
+            raise elasticsearch.TransportError(400, "search_phase_execution_exception", search["error"])
+        search["response"] = response
+        return response
+
+
+async def record(mode: str) -> list:
+    from app.plugins import downloads
+
+    recorded = []
+    synthetic_downloads = make_downloads()
+    for project, duration, max_hits, max_buckets in CASES:
+        downloads.query_bucket_limits.clear()
+        for provider, field_names in downloads.FIELD_NAMES.items():
+            es = SyntheticES(synthetic_downloads, max_buckets if mode == "searches" else None)
+            setattr(downloads, "es_client", es)  # Stands in for the real client, see SyntheticES.search
+            if mode == "searches":
+                await downloads.make_query(
+                    provider, field_names, project, duration, downloads.DEFAULT_FILTERS, max_hits=max_hits
+                )
+                recorded.extend(es.searches)
+            else:  # One search for the top artifacts by downloads and by traffic, with all their details
+                # This builder only exists in the code before user-012, which legacy mode imports instead
+                artifacts_query_body = getattr(downloads, "artifacts_query_body")
+                body = downloads.query_body(
+                    artifacts_query_body, provider, field_names, downloads.DEFAULT_FILTERS,
+                    project=project, timespan=downloads.time_range(duration), max_hits=max_hits,
+                    max_ua=downloads.MAX_HITS_UA,
+                )
+                recorded.append(
+                    {
+                        "project": project,
+                        "duration": duration,
+                        "max_hits": max_hits,
+                        "provider": provider,
+                        "response": await es.search(index=f"{provider}-*", body=body),
+                    }
+                )
+    return recorded
+
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else ""
+    assert mode in ("searches", "legacy"), __doc__
+    sys.path.insert(0, os.path.dirname(FIXTURES_DIR))
+    # Sets up the configuration and app the plugins need
+    import conftest  # pylint: disable=unused-import,import-outside-toplevel
+
+    if mode == "legacy":
+        sys.path.insert(0, os.path.abspath(sys.argv[2]))
+    recorded = asyncio.run(record(mode))
+    with open(SEARCHES_FILE if mode == "searches" else LEGACY_FILE, "wb") as f:
+        f.write(gzip.compress(json.dumps(recorded, separators=(",", ":"), sort_keys=True).encode("utf-8"), mtime=0))
+    print(f"Recorded {len(recorded)} responses")
+
+
+if __name__ == "__main__":
+    main()
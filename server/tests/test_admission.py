@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Tests for admission control: work that someone interactive is waiting for must not wait behind background work"""
+import asyncio
+
+from app.lib import admission
+from app.plugins import downloads
+
+
+def make_controller() -> admission.AdmissionController:
+    return admission.AdmissionController(interactive_limit=2, background_limit=1, max_queued=4, max_wait=1)
+
+
+async def hold_slot(controller: admission.AdmissionController, priority: str, release: asyncio.Event):
+    async with controller.admit(priority):
+        await release.wait()
+
+
+async def admitted_work(controller: admission.AdmissionController, priority) -> str:
+    admission.current_priority.set(priority)
+    async with controller.admit():
+        return "done"
+
+
+def test_promoted_background_work_runs_on_interactive_slot():
+    async def run():
+        controller = make_controller()
+        release = asyncio.Event()
+        blocker = asyncio.create_task(hold_slot(controller, admission.BACKGROUND, release))
+        shared = admission.SharedPriority(admission.BACKGROUND)
+        work = asyncio.create_task(admitted_work(controller, shared))
+        await asyncio.sleep(0.01)
+        assert not work.done() and controller.stats[admission.BACKGROUND]["queued"] == 1
+        shared.raise_to(admission.INTERACTIVE)
+        assert await asyncio.wait_for(work, 1) == "done"
+        assert controller.admitted == {admission.INTERACTIVE: 1, admission.BACKGROUND: 1}
+        assert not shared.queued
+        release.set()
+        await blocker
+        assert controller.running == {admission.INTERACTIVE: 0, admission.BACKGROUND: 0}
+
+    asyncio.run(run())
+
+
+def test_unpromoted_background_work_waits():
+    async def run():
+        controller = make_controller()
+        release = asyncio.Event()
+        blocker = asyncio.create_task(hold_slot(controller, admission.BACKGROUND, release))
+        shared = admission.SharedPriority(admission.BACKGROUND)
+        work = asyncio.create_task(admitted_work(controller, shared))
+        shared.raise_to(admission.BACKGROUND)  # Not higher, so nothing changes
+        await asyncio.sleep(0.05)
+        assert not work.done()
+        release.set()
+        assert await asyncio.wait_for(work, 1) == "done"
+        await blocker
+        assert controller.admitted == {admission.INTERACTIVE: 0, admission.BACKGROUND: 2}
+
+    asyncio.run(run())
+
+
+def test_interactive_request_joining_background_refresh(monkeypatch):
+    controller = make_controller()
+    monkeypatch.setattr(downloads, "search_admission", controller)
+
+    async def fake_query_stats(*_args):
+        async with controller.admit():
+            return "stats"
+
+    monkeypatch.setattr(downloads, "query_stats", fake_query_stats)
+
+    async def run():
+        release = asyncio.Event()
+        blocker = asyncio.create_task(hold_slot(controller, admission.BACKGROUND, release))
+        cache_key = ("httpd", 7, downloads.normalize_filters(downloads.DEFAULT_FILTERS))
+        refresh = downloads.refresh_stats(cache_key)
+        await asyncio.sleep(0.01)
+        assert controller.stats[admission.BACKGROUND]["queued"] == 1
+        # The refresh is still queued behind the background search, yet the request gets its stats right away
+        assert await asyncio.wait_for(downloads.generate_stats("httpd", 7), 1) == "stats"
+        assert refresh.done() and downloads.downloads_inflight.stats["coalesced"] >= 1
+        assert not downloads.inflight_priorities
+        release.set()
+        await blocker
+
+    downloads.downloads_data_cache.delete(("httpd", 7, downloads.normalize_filters(downloads.DEFAULT_FILTERS)))
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Tests for the ASF-wide download index: writing a project's report must only rewrite that project's entry"""
+import os
+
+from app.lib import downloadindex
+
+
+def make_files(prefix: str, count: int) -> dict:
+    return {
+        f"{prefix}-{n}.tar.gz": {"hits": n * 10, "hits_unique": n, "bytes": (count - n) * 1000} for n in range(count)
+    }
+
+
+def test_update_writes_one_file_per_project(tmp_path):
+    index = downloadindex.DownloadIndex(str(tmp_path), top_artifacts=3)
+    index.update("httpd", "2024-05", make_files("httpd", 5))
+    month_dir = os.path.join(tmp_path, downloadindex.INDEX_DIR, "2024-05")
+    os.utime(os.path.join(month_dir, "httpd.json"), ns=(0, 0))
+    index.update("ponymail", "2024-05", make_files("ponymail", 4))
+    assert sorted(os.listdir(month_dir)) == ["httpd.json", "ponymail.json"]
+    assert os.stat(os.path.join(month_dir, "httpd.json")).st_mtime_ns == 0  # Left alone
+    assert index.months() == ["2024-05"]
+    assert index.totals("2024-05") == {
+        "httpd": {"hits": 100, "hits_unique": 10, "bytes": 15000, "artifacts": 5},
+        "ponymail": {"hits": 60, "hits_unique": 6, "bytes": 10000, "artifacts": 4},
+    }
+
+
+def test_index_reloads_from_disk(tmp_path):
+    index = downloadindex.DownloadIndex(str(tmp_path), top_artifacts=3)
+    index.update("httpd", "2024-05", make_files("httpd", 5))
+    index.update("ponymail", "2024-05", make_files("ponymail", 4))
+    index.update("httpd", "2024-06", make_files("httpd", 2))
+    top = index.top_artifacts("2024-05", sort="hits")
+    assert [x["artifact"] for x in top] == ["httpd-4.tar.gz", "httpd-3.tar.gz", "ponymail-3.tar.gz"]
+    # Replacing a project's numbers updates the ASF-wide top artifacts
+    index.update("ponymail", "2024-05", make_files("ponymail", 9))
+    assert index.top_artifacts("2024-05", sort="hits", limit=1)[0]["artifact"] == "ponymail-8.tar.gz"
+
+    reloaded = downloadindex.DownloadIndex(str(tmp_path), top_artifacts=3)
+    assert reloaded.months() == ["2024-05", "2024-06"]
+    assert reloaded.totals("2024-05") == index.totals("2024-05")
+    assert reloaded.top_artifacts("2024-05", sort="bytes") == index.top_artifacts("2024-05", sort="bytes")
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Tests for looking up projects and podlings in download stats requests"""
+import pytest
+
+from app.plugins import downloads
+
+
+@pytest.mark.parametrize("projects", [set(), {"httpd", "ponymail"}])
+def test_known_projects_and_podlings(monkeypatch, projects):
+    monkeypatch.setattr(downloads, "known_projects", projects)
+    assert downloads.is_known_project("httpd")
+    assert downloads.is_known_project("ponymail")
+    assert downloads.is_known_project("incubator/ponymail")  # As the UI suggests looking up podlings
+
+
+def test_unknown_projects(monkeypatch):
+    monkeypatch.setattr(downloads, "known_projects", {"httpd", "ponymail"})
+    assert not downloads.is_known_project("nope")
+    assert not downloads.is_known_project("incubator/nope")
+    monkeypatch.setattr(downloads, "known_projects", set())
+    assert not downloads.is_known_project("../etc")
+    assert not downloads.is_known_project("incubator/")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Tests for the download stats searches against recorded ES responses (see fixtures/record_downloads.py):
+searching the top artifacts first and their details once per artifact must give the same stats as the single
+search with all details for both the top artifacts by downloads and by traffic, which it replaced."""
+import asyncio
+import gzip
+import json
+import os
+
+import elasticsearch
+import pytest
+
+from app.plugins import downloads
+from fixtures import record_downloads
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(filename: str) -> list:
+    with open(os.path.join(FIXTURES_DIR, filename), "rb") as f:
+        return json.loads(gzip.decompress(f.read()))
+
+
+class ReplayES:
+    """Answers searches with the recorded responses (or errors) for the exact same index and search body"""
+
+    def __init__(self, searches: list):
+        self.recorded = {self.search_key(x["index"], x["body"]): x for x in searches}
+        self.replayed: set = set()
+
+    @staticmethod
+    def search_key(index: str, body: dict) -> str:
+        return index + json.dumps(body, sort_keys=True)
+
+    async def search(self, index, body, **_kwargs):
+        key = self.search_key(index, json.loads(json.dumps(body)))
+        assert key in self.recorded, "Search body not recorded, re-record with tests/fixtures/record_downloads.py"
+        self.replayed.add(key)
+        search = self.recorded[key]
+        if "error" in search:
+            raise elasticsearch.TransportError(400, "search_phase_execution_exception", search["error"])
+        return search["response"]
+
+
+def collate(project: str, response: dict) -> dict:
+    stats: dict = {}
+    downloads.collate_response(project, downloads.DEFAULT_FILTERS, response, stats, [])
+    return downloads.stats_as_json(stats)
+
+
+@pytest.fixture(name="replay_es")
+def fixture_replay_es(monkeypatch):
+    replay_es = ReplayES(load_fixture("downloads_searches.json.gz"))
+    monkeypatch.setattr(downloads, "es_client", replay_es)
+    return replay_es
+
+
+def test_same_stats_as_single_search(replay_es):
+    legacy = load_fixture("downloads_legacy.json.gz")
+    assert legacy
+    previous_case = None
+    for case in legacy:
+        # Page sizes learnt from too many buckets errors carry over between providers, as when recording
+        if (case["project"], case["duration"], case["max_hits"]) != previous_case:
+            downloads.query_bucket_limits.clear()
+            previous_case = (case["project"], case["duration"], case["max_hits"])
+        response = asyncio.run(
+            downloads.make_query(
+                case["provider"],
+                downloads.FIELD_NAMES[case["provider"]],
+                case["project"],
+                case["duration"],
+                downloads.DEFAULT_FILTERS,
+                max_hits=case["max_hits"],
+            )
+        )
+        stats = collate(case["project"], response)
+        assert stats, "No artifacts found, the test would not compare anything"
+        assert stats == collate(case["project"], case["response"]), case
+    # Every recorded search was made, including the too many buckets errors that have the details searched in pages
+    assert replay_es.replayed == set(replay_es.recorded)
+    assert any("error" in search for search in replay_es.recorded.values())
+
+
+def test_artifact_in_both_top_lists_is_searched_once(replay_es):
+    downloads.query_bucket_limits.clear()
+    field_names = downloads.FIELD_NAMES["fastly"]
+    response = asyncio.run(downloads.make_query("fastly", field_names, "httpd", 7, downloads.DEFAULT_FILTERS, max_hits=6))
+    most_downloads = {bucket["key"] for bucket in response["aggregations"]["most_downloads"]["buckets"]}
+    most_traffic = {bucket["key"] for bucket in response["aggregations"]["most_traffic"]["buckets"]}
+    assert most_downloads & most_traffic and most_downloads != most_traffic
+    details_searches = [
+        json.loads(key[len("fastly-*") :])
+        for key in replay_es.replayed
+        if "artifacts" in json.loads(key[len("fastly-*") :])["aggs"]
+    ]
+    assert len(details_searches) == 1
+    assert sorted(details_searches[0]["aggs"]["artifacts"]["terms"]["include"]) == sorted(most_downloads | most_traffic)
+
+
+def test_span_in_days():
+    assert downloads.span_in_days(7) == 7
+    assert downloads.span_in_days(downloads.whole_days(7)) == 8  # Plus today so far
+    assert downloads.span_in_days(downloads.day_query(1714521600)) == 1
+    assert downloads.span_in_days("now-1M/M") == 31
+
+
+@pytest.mark.parametrize("max_buckets", [None, 150])
+def test_batch_same_stats_as_single_project(monkeypatch, max_buckets):
+    synthetic_downloads = record_downloads.make_downloads()
+    projects = ["httpd", "nope", "ponymail"]
+    for provider, field_names in downloads.FIELD_NAMES.items():
+        downloads.query_bucket_limits.clear()
+        single_es = record_downloads.SyntheticES(synthetic_downloads, max_buckets)
+        monkeypatch.setattr(downloads, "es_client", single_es)
+        expected = {
+            project: asyncio.run(downloads.make_query(provider, field_names, project, 7, downloads.DEFAULT_FILTERS, max_hits=8))
+            for project in projects
+        }
+        downloads.query_bucket_limits.clear()
+        batch_es = record_downloads.SyntheticES(synthetic_downloads, max_buckets)
+        monkeypatch.setattr(downloads, "es_client", batch_es)
+        responses = asyncio.run(
+            downloads.make_batch_query(provider, field_names, projects, 7, downloads.DEFAULT_FILTERS, max_hits=8)
+        )
+        for project in projects:
+            assert collate(project, responses[project]) == collate(project, expected[project]), (provider, project)
+        assert collate("httpd", responses["httpd"]) and not collate("nope", responses["nope"])
+        # Only the top artifacts search is batched, the details are searched per project as usual
+        batched = [search for search in batch_es.searches if "per_project" in search["body"]["aggs"]]
+        assert len(batched) == 1 and "error" not in batched[0]
+        assert len(batch_es.searches) == len(single_es.searches) - len(projects) + 1
+        # With a bucket limit, the details are paged, just as for a single project
+        assert any("error" in search for search in batch_es.searches) == (max_buckets is not None)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Tests for the Jira statistics: the arithmetic SLA weekend discounts must match stepping through the span,
+Jira timestamps must parse as they did with time.strptime, and Jira searches must survive pages that fail."""
+import asyncio
+import datetime
+import random
+import re
+import time
+
+import aiohttp
+import pytest
+
+from app.plugins import jirastats
+
+DAY = 86400
+FRIDAY_2100 = 1717189200  # Fri 2024-05-31 21:00 UTC, the start of a weekend
+MONDAY_0800 = FRIDAY_2100 + jirastats.WEEKEND_LENGTH  # Mon 2024-06-03 08:00 UTC, the end of it
+
+
+def stepping_sla_duration(from_epoch, to_epoch):
+    """The original implementation, stepping through the span 10 minutes at a time, kept as a test oracle"""
+    seconds_spent = to_epoch - from_epoch  # Add seconds between the two transitions
+    dt_start = datetime.datetime.utcfromtimestamp(from_epoch)
+    dt_end = datetime.datetime.utcfromtimestamp(to_epoch)
+    total_discount = 0
+    dt_temp = dt_start
+    while dt_temp < dt_end and total_discount < seconds_spent:
+        dt_temp += datetime.timedelta(seconds=jirastats.DEFAULT_DISCOUNT_DELTA)
+        if (
+            dt_temp.weekday() in [5, 6]  # Sat, Sun
+            or (dt_temp.weekday() == 4 and dt_temp.hour > 20)  # Fri after 8pm UTC
+            or (dt_temp.weekday() == 0 and dt_temp.hour < 8)  # Mon before 8am UTC
+        ):
+            total_discount += jirastats.DEFAULT_DISCOUNT_DELTA
+    seconds_spent -= min(seconds_spent, total_discount)
+    return seconds_spent
+
+
+def random_epoch(rng: random.Random) -> int:
+    """A random moment, biased towards the edges that matter: weekend starts and ends, and whole steps"""
+    week = rng.randrange(-200, 200) * jirastats.WEEK_SECONDS
+    choice = rng.random()
+    if choice < 0.3:  # Around the start or end of a weekend
+        edge = rng.choice((FRIDAY_2100, MONDAY_0800))
+        return edge + week + rng.randint(-2 * jirastats.DEFAULT_DISCOUNT_DELTA, 2 * jirastats.DEFAULT_DISCOUNT_DELTA)
+    if choice < 0.5:  # On a whole 10 minute step
+        return FRIDAY_2100 + week + rng.randrange(0, jirastats.WEEK_SECONDS, jirastats.DEFAULT_DISCOUNT_DELTA)
+    return FRIDAY_2100 + week + rng.randrange(0, jirastats.WEEK_SECONDS)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_sla_duration_matches_stepping(seed):
+    rng = random.Random(seed)
+    for _ in range(250):
+        from_epoch = random_epoch(rng)
+        if rng.random() < 0.05:  # Backwards spans count as no time spent
+            to_epoch = from_epoch - rng.randint(1, 3 * DAY)
+        else:  # Spans from minutes to months, as tickets take
+            to_epoch = from_epoch + rng.randint(0, rng.choice((3600, 3 * DAY, 10 * DAY, 60 * DAY)))
+        assert jirastats.JiraTicket.calc_sla_duration(from_epoch, to_epoch) == stepping_sla_duration(
+            from_epoch, to_epoch
+        ), (from_epoch, to_epoch)
+
+
+def test_sla_duration_edges():
+    for offset in range(-3 * jirastats.DEFAULT_DISCOUNT_DELTA, 3 * jirastats.DEFAULT_DISCOUNT_DELTA, 60):
+        for from_epoch, to_epoch in (
+            (FRIDAY_2100 + offset, FRIDAY_2100 + offset + DAY),
+            (MONDAY_0800 + offset - DAY, MONDAY_0800 + offset),
+            (FRIDAY_2100 + offset, MONDAY_0800),
+            (FRIDAY_2100, MONDAY_0800 + offset),
+            (FRIDAY_2100 + offset, FRIDAY_2100 + offset),  # Empty span
+            (MONDAY_0800, FRIDAY_2100 + offset),  # Backwards
+        ):
+            assert jirastats.JiraTicket.calc_sla_duration(from_epoch, to_epoch) == stepping_sla_duration(
+                from_epoch, to_epoch
+            ), (from_epoch, to_epoch)
+    # A whole week only counts the working days, from Monday 08:00 to Friday 21:00
+    assert jirastats.JiraTicket.calc_sla_duration(MONDAY_0800, MONDAY_0800 + jirastats.WEEK_SECONDS) == (
+        jirastats.WEEK_SECONDS - jirastats.WEEKEND_LENGTH
+    )
+    # Steps land at the end of each 10 minutes, so the one landing on Monday 08:00 is working time
+    assert jirastats.JiraTicket.calc_sla_duration(FRIDAY_2100, MONDAY_0800) == jirastats.DEFAULT_DISCOUNT_DELTA
+
+
+def strptime_jira_time(string):
+    """The original timestamp parser, kept as a test oracle. It ignored UTC offsets, and only gave UTC epochs
+    when running in UTC, which the servers do."""
+    ts = time.strptime(re.sub(r"\..*", "", str(string)), "%Y-%m-%dT%H:%M:%S")
+    epoch_local = time.mktime(ts)
+    utc_offset = (
+        datetime.datetime.fromtimestamp(epoch_local) - datetime.datetime.utcfromtimestamp(epoch_local)
+    ).total_seconds()
+    return int(epoch_local + utc_offset)
+
+
+@pytest.fixture(name="utc")
+def fixture_utc(monkeypatch):
+    monkeypatch.setenv("TZ", "UTC")
+    time.tzset()
+    jirastats.parse_jira_time.cache_clear()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.usefixtures("utc")
+@pytest.mark.parametrize("year", range(1990, 2040, 10))
+def test_jira_time_matches_strptime(year):
+    # Every 7th hour of the decade, so every hour of every weekday, at varying minutes, seconds and milliseconds
+    start = datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc)
+    for hour in range(0, 10 * 8766, 7):
+        epoch = int(start.timestamp()) + hour * 3600 + hour * 61 % 3600
+        string = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(epoch)) + f".{hour % 1000:03d}+0000"
+        assert jirastats.parse_jira_time(string) == strptime_jira_time(string) == epoch, string
+
+
+@pytest.mark.parametrize("offset_minutes", range(-12 * 60, 14 * 60 + 1, 15))
+def test_jira_time_offsets(offset_minutes):
+    sign = "-" if offset_minutes < 0 else "+"
+    hours, minutes = divmod(abs(offset_minutes), 60)
+    for local_time in ("2024-05-01T10:00:00", "2024-12-31T23:59:59.999", "2024-02-29T00:00:00.1"):
+        expected = datetime.datetime.fromisoformat(f"{local_time}{sign}{hours:02d}:{minutes:02d}").timestamp()
+        for offset in (f"{sign}{hours:02d}{minutes:02d}", f"{sign}{hours:02d}:{minutes:02d}"):
+            assert jirastats.parse_jira_time(local_time + offset) == int(expected), local_time + offset
+
+
+def test_jira_time_formats():
+    epoch = 1714557600  # 2024-05-01 10:00 UTC
+    assert jirastats.parse_jira_time("2024-05-01T10:00:00.000+0000") == epoch
+    assert jirastats.parse_jira_time("2024-05-01T10:00:00.000Z") == epoch
+    assert jirastats.parse_jira_time("2024-05-01T10:00:00Z") == epoch
+    assert jirastats.parse_jira_time("2024-05-01T10:00:00") == epoch  # No offset is UTC
+    assert jirastats.parse_jira_time("2024-05-01T10:00:00.999999") == epoch  # Fractions are dropped, not rounded
+    assert jirastats.parse_jira_time("2024-05-01T10:00:00.000+0100") == epoch - 3600
+    assert jirastats.parse_jira_time("2024-05-01T10:00:00.000-05:30") == epoch + 19800
+    for string in ("", "2024-05-01", "2024-05-01 10:00:00", "2024-05-01T10:00:00+01", "2024-05-01T10:00:00.+0000"):
+        with pytest.raises(ValueError):
+            jirastats.parse_jira_time(string)
+
+
+class FakeJiraSession:
+    """Answers Jira searches with pages of [page_size] issues out of [total], failing the pages in [errors]"""
+
+    def __init__(self, total: int, page_size: int, errors: dict):
+        self.total = total
+        self.page_size = page_size
+        self.errors = errors
+
+    def __call__(self, **_kwargs):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+    def get(self, _url, params):
+        start_at = int(params["startAt"])
+        if start_at in self.errors:
+            raise self.errors[start_at]
+        return FakeJiraResponse(
+            {
+                "total": self.total,
+                "maxResults": self.page_size,
+                "issues": [{"key": f"INFRA-{n}"} for n in range(start_at, min(self.total, start_at + self.page_size))],
+            }
+        )
+
+
+class FakeJiraResponse:
+    status = 200
+
+    def __init__(self, page: dict):
+        self.page = page
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+    async def json(self):
+        return self.page
+
+
+@pytest.mark.parametrize(
+    "errors",
+    [
+        {0: aiohttp.ClientConnectionError("Connection reset")},
+        {100: aiohttp.ClientConnectionError("Connection reset")},
+        {200: asyncio.TimeoutError()},
+        {100: aiohttp.ServerDisconnectedError(), 200: asyncio.TimeoutError()},
+    ],
+)
+def test_search_with_failing_pages(monkeypatch, errors):
+    monkeypatch.setattr(jirastats.aiohttp, "ClientSession", FakeJiraSession(250, 100, errors))
+    keys = []
+    assert asyncio.run(jirastats.jira_search({"jql": "project=INFRA"}, keys.extend)) is None
+    if 0 in errors:  # Without the first page, we don't know what else to fetch
+        assert not keys
+    else:  # The other pages still arrive
+        assert len(keys) == 250 - sum(min(100, 250 - start_at) for start_at in errors)
+
+
+def test_search_all_pages(monkeypatch):
+    monkeypatch.setattr(jirastats.aiohttp, "ClientSession", FakeJiraSession(250, 100, {}))
+    keys = []
+    assert asyncio.run(jirastats.jira_search({"jql": "project=INFRA"}, keys.extend)) == 250
+    assert sorted(issue["key"] for issue in keys) == sorted(f"INFRA-{n}" for n in range(250))
+
+
+@pytest.mark.parametrize("failing_batch", [None, 0, 1])
+def test_refresh_with_failing_search(monkeypatch, failing_batch):
+    batches = []
+
+    async def fake_search(params, on_page):
+        batches.append(params["jql"])
+        if len(batches) - 1 == failing_batch:
+            return None
+        on_page([{"key": "INFRA-1"}])
+        return 1
+
+    monkeypatch.setattr(jirastats, "jira_search", fake_search)
+    monkeypatch.setattr(jirastats, "process_cache", len)
+    keys = {f"INFRA-{n}" for n in range(jirastats.DEFAULT_REFRESH_BATCH + 1)}
+    processed = asyncio.run(jirastats.jira_refresh(keys))
+    assert len(batches) == 2  # A failed batch doesn't stop the others
+    assert processed == (2 if failing_batch is None else None)
+
+
+def test_failed_refresh_schedules_scan(monkeypatch):
+    async def failing_refresh(_keys):
+        return None
+
+    async def refresh_until_scheduled():
+        jirastats._refresh_pending = asyncio.Event()  # pylint: disable=protected-access
+        task = asyncio.create_task(jirastats.refresh_loop())
+        jirastats._refresh_keys.add("INFRA-1")  # pylint: disable=protected-access
+        jirastats._refresh_pending.set()  # pylint: disable=protected-access
+        while not jirastats._scan_schedule:  # pylint: disable=protected-access
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    monkeypatch.setattr(jirastats, "jira_refresh", failing_refresh)
+    monkeypatch.setattr(jirastats, "DEFAULT_REFRESH_DELAY", 0)
+    monkeypatch.setattr(jirastats, "_scan_schedule", [])
+    monkeypatch.setattr(jirastats, "_refresh_pending", None)
+    asyncio.run(asyncio.wait_for(refresh_until_scheduled(), 5))
+    assert len(jirastats._scan_schedule) == 1  # pylint: disable=protected-access
+
+
+def make_issue(key: str, status: str, updated: str) -> dict:
+    return {
+        "key": key,
+        "fields": {
+            "assignee": None,
+            "status": {"name": status},
+            "summary": "Help",
+            "created": "2024-05-01T10:00:00.000+0000",
+            "updated": updated,
+            "priority": {"name": "Major"},
+            "creator": {"name": "reporter"},
+            "issuetype": {"name": "Task"},
+        },
+    }
+
+
+@pytest.mark.parametrize("status", ["Waiting for Infra", "Closed"])
+def test_older_issues_do_not_replace_newer_tickets(monkeypatch, status):
+    monkeypatch.setattr(jirastats, "_stats", {})
+    newer = make_issue("INFRA-1", status, "2024-05-02T10:00:00.000+0000")
+    older = make_issue("INFRA-1", "Waiting for Infra", "2024-05-01T12:00:00.000+0000")
+    assert jirastats.process_cache([newer]) == 1
+    ticket = jirastats._stats["INFRA-1"]  # pylint: disable=protected-access
+    # A scan page fetched before a refresh, but merged after it
+    assert jirastats.process_cache([older]) == 0
+    assert jirastats._stats["INFRA-1"] is ticket  # pylint: disable=protected-access
+    # The same update again is only rebuilt for open tickets, as their SLA clock keeps running
+    assert jirastats.process_cache([newer]) == (0 if status == "Closed" else 1)
+    # Newer updates always are
+    assert jirastats.process_cache([make_issue("INFRA-1", "Closed", "2024-05-03T10:00:00.000+0000")]) == 1
+    assert jirastats._stats["INFRA-1"].closed  # pylint: disable=protected-access
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Tests for precompiled search body templates: rendered bodies must be byte-identical to the builders' own"""
+import itertools
+import json
+
+import pytest
+
+from app.lib import querytemplate
+from app.plugins import downloads
+
+FILTER_SETS = ("", "empty_ua", "no_query", "empty_ua,no_query", "no_query, empty_ua")
+DURATIONS = (1, 7, 30, "now-1M/M", "now-6M/M", downloads.whole_days(7))
+PROJECTS = ("httpd", "ponymail", "commons-lang")
+ARTIFACTS = (
+    ["/httpd/httpd-2.4.62.tar.gz"],
+    ["/httpd/httpd-2.4.62.tar.gz", "/httpd/httpd-2.4.62.tar.bz2", "/incubator/ponymail/foo.zip"],
+)
+
+
+def assert_identical(rendered: dict, built: dict):
+    assert json.dumps(rendered) == json.dumps(built)
+
+
+@pytest.mark.parametrize("provider,filters", list(itertools.product(downloads.FIELD_NAMES, FILTER_SETS)))
+def test_top_artifacts_bodies(provider, filters):
+    field_names = downloads.FIELD_NAMES[provider]
+    for project, duration, max_hits in itertools.product(PROJECTS, DURATIONS, (1, downloads.MAX_HITS)):
+        timespan = downloads.time_range(duration)
+        rendered = downloads.query_body(
+            downloads.top_artifacts_query_body, provider, field_names, filters,
+            project=project, timespan=timespan, max_hits=max_hits,
+        )
+        built = downloads.top_artifacts_query_body(field_names, filters, project, timespan, max_hits)
+        assert_identical(rendered, built)
+
+
+@pytest.mark.parametrize("provider,filters", list(itertools.product(downloads.FIELD_NAMES, FILTER_SETS)))
+def test_artifact_details_bodies(provider, filters):
+    field_names = downloads.FIELD_NAMES[provider]
+    for project, duration, artifacts in itertools.product(PROJECTS, DURATIONS, ARTIFACTS):
+        timespan = downloads.time_range(duration)
+        rendered = downloads.query_body(
+            downloads.artifact_details_query_body, provider, field_names, filters,
+            project=project, timespan=timespan, max_hits=len(artifacts), max_ua=downloads.MAX_HITS_UA,
+            include=artifacts,
+        )
+        built = downloads.artifact_details_query_body(
+            field_names, filters, project, timespan, len(artifacts), downloads.MAX_HITS_UA, artifacts
+        )
+        assert_identical(rendered, built)
+
+
+def test_templates_are_reused():
+    downloads.query_templates.clear()
+    field_names = downloads.FIELD_NAMES["fastly"]
+    for project, duration in itertools.product(PROJECTS, DURATIONS):
+        downloads.query_body(
+            downloads.top_artifacts_query_body, "fastly", field_names, "no_query,empty_ua",
+            project=project, timespan=downloads.time_range(duration), max_hits=downloads.MAX_HITS,
+        )
+    downloads.query_body(
+        downloads.top_artifacts_query_body, "fastly", field_names, "empty_ua,no_query",
+        project="httpd", timespan=downloads.time_range(7), max_hits=downloads.MAX_HITS,
+    )
+    assert len(downloads.query_templates) == 1  # Equivalent filter sets share a template
+
+
+def test_render_does_not_modify_template():
+    template = querytemplate.QueryTemplate(
+        lambda project, size: {"query": {"prefix": {"uri": f"/{project}/"}}, "size": size, "fixed": {"a": [1, 2]}},
+        ("project", "size"),
+    )
+    first = template.render(project="httpd", size=60)
+    first["query"]["prefix"]["uri"] = "changed"
+    second = template.render(project="kafka", size={"nested": True})
+    assert second == {"query": {"prefix": {"uri": "/kafka/"}}, "size": {"nested": True}, "fixed": {"a": [1, 2]}}
+    assert second["fixed"] is template.body["fixed"]  # Parts without placeholders are shared, not copied